@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import typing
+from importlib import metadata
+
+from ecs_deplojo import utils
+
+# Cached task definitions are only valid for the version which generated them
+try:
+    VERSION = metadata.version("ecs-deplojo")
+except metadata.PackageNotFoundError:
+    VERSION = "unknown"
+
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+
+
+class GenerationCache:
+    """Store generated task definitions on disk between runs.
+
+    Every entry is a JSON file named after the key of the inputs used to
+    generate it, see `make_key()`. Reading an entry updates its modification
+    time so that when the total size of the cache exceeds `max_size` the
+    least recently used entries are removed first.
+
+    """
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        filename = self._filename(key)
+        try:
+            with open(filename, "r") as fh:
+                data = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def set(self, key: str, data: typing.Dict[str, typing.Any]) -> None:
+        utils.write_file(self._filename(key), json.dumps(data, default=dict))
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cache fits in
+        `max_size`. Returns the number of removed entries.
+        """
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+        num = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            num += 1
+        return num
+
+    def _filename(self, key: str) -> str:
+        return os.path.join(self.directory, "%s.json" % key)
+
+
+def make_key(*inputs: typing.Any) -> str:
+    """Return a key for the given (JSON serializable) inputs.
+
+    Mappings are serialized with sorted keys, so the order in which they were
+    defined in the config doesn't matter.
+    """
+    data = json.dumps(
+        [VERSION, *inputs], sort_keys=True, separators=(",", ":"), default=dict
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
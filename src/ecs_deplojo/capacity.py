@@ -0,0 +1,124 @@
+import typing
+
+from ecs_deplojo.connection import Connection
+from ecs_deplojo.task_definitions import TaskDefinition
+from ecs_deplojo.utils import parse_int
+
+
+class Resources(typing.NamedTuple):
+    cpu: int
+    memory: int
+
+
+# A service to schedule: the name, the size of a task and the number of
+# extra tasks ECS starts during the rolling update
+Request = typing.Tuple[str, Resources, int]
+
+
+def sample_capacity(
+    connection: Connection, cluster_name: str
+) -> typing.List[Resources]:
+    """Return the remaining cpu and memory of every active container instance
+    in the cluster."""
+    arns: typing.List[str] = []
+    paginator = connection.ecs.get_paginator("list_container_instances")
+    for page in paginator.paginate(cluster=cluster_name, status="ACTIVE"):
+        arns.extend(page["containerInstanceArns"])
+
+    result = []
+    for i in range(0, len(arns), 100):
+        response = connection.ecs.describe_container_instances(
+            cluster=cluster_name, containerInstances=arns[i : i + 100]
+        )
+        for instance in response["containerInstances"]:
+            if not instance.get("agentConnected", True):
+                continue
+            remaining = {
+                item["name"]: item.get("integerValue", 0)
+                for item in instance.get("remainingResources", [])
+            }
+            result.append(
+                Resources(remaining.get("CPU", 0), remaining.get("MEMORY", 0))
+            )
+    return result
+
+
+def task_size(task_definition: TaskDefinition) -> Resources:
+    """Return the resources reserved by a task of the task definition.
+
+    The task level cpu and memory are used when they are set, otherwise the
+    sum of the (reserved) cpu and memory of the containers.
+    """
+    containers = task_definition.container_definitions or []
+    cpu = parse_int(task_definition.cpu)
+    if cpu is None:
+        cpu = sum(container.get("cpu") or 0 for container in containers)
+    memory = parse_int(task_definition.memory)
+    if memory is None:
+        memory = sum(
+            container.get("memoryReservation") or container.get("memory") or 0
+            for container in containers
+        )
+    return Resources(cpu, memory)
+
+
+def surge_tasks(service: typing.Dict[str, typing.Any]) -> int:
+    """Return the number of tasks ECS starts on top of the desired count
+    during a rolling update of the service.
+
+    Services not running on container instances of the cluster (Fargate or
+    a capacity provider) don't need capacity.
+    """
+    if service.get("launchType", "EC2") != "EC2" or service.get(
+        "capacityProviderStrategy"
+    ):
+        return 0
+    desired = service.get("desiredCount", 0)
+    configuration = service.get("deploymentConfiguration") or {}
+    maximum = configuration.get("maximumPercent", 200)
+    return max(desired * maximum // 100 - desired, 0)
+
+
+def plan_batch(
+    requests: typing.Sequence[Request], capacity: typing.Sequence[Resources]
+) -> typing.Tuple[typing.List[str], typing.List[str]]:
+    """Split the services in the ones which can be updated together within
+    the capacity of the cluster and the ones which need to wait.
+
+    The extra tasks of a service are placed on the container instances in
+    order (first fit), services which don't fit are skipped. When none of
+    the services fit the first one is still updated: ECS can make room by
+    stopping old tasks, as allowed by the minimum healthy percent.
+    """
+    free = list(capacity)
+    batch = []
+    deferred = []
+    for name, size, count in requests:
+        placed = _place(free, size, count)
+        if placed is None:
+            deferred.append(name)
+        else:
+            free = placed
+            batch.append(name)
+
+    if not batch and deferred:
+        batch.append(deferred.pop(0))
+    return batch, deferred
+
+
+def _place(
+    free: typing.List[Resources], size: Resources, count: int
+) -> typing.Optional[typing.List[Resources]]:
+    """Return the capacity left after placing `count` tasks, or None if they
+    don't fit."""
+    free = list(free)
+    for _ in range(count):
+        for i, instance in enumerate(free):
+            if instance.cpu >= size.cpu and instance.memory >= size.memory:
+                free[i] = Resources(
+                    instance.cpu - size.cpu, instance.memory - size.memory
+                )
+                break
+        else:
+            return None
+    return free
@@ -1,16 +1,30 @@
+import concurrent.futures
+import contextlib
 import os.path
 import re
 import sys
+import time
 import tokenize
 import typing
 
 import click
-import yaml
 
-from ecs_deplojo.connection import Connection
+from ecs_deplojo import profiling
+from ecs_deplojo.cache import GenerationCache
+from ecs_deplojo.config import load_config
+from ecs_deplojo.connection import Connection, get_connection
 from ecs_deplojo.deployment import DeploymentFailed, start_deployment
-from ecs_deplojo.logger import logger
-from ecs_deplojo.task_definitions import generate_task_definitions
+from ecs_deplojo.exceptions import ValidationError
+from ecs_deplojo.history import History
+from ecs_deplojo.logger import LOG_FORMATS, configure_logging, logger
+from ecs_deplojo.task_definitions import (
+    WORKER_TYPES,
+    TaskDefinition,
+    TemplateCache,
+    generate_task_definitions,
+    write_manifest,
+)
+from ecs_deplojo.validation import validate_config, validate_task_definitions
 
 
 class VarType(click.ParamType):
@@ -33,63 +47,276 @@ class VarType(click.ParamType):
 @click.option("--var", multiple=True, type=VarType())
 @click.option("--dry-run", is_flag=True, default=False)
 @click.option("--output-path", required=False, type=click.Path())
+@click.option("--manifest-path", required=False, type=click.Path())
 @click.option("--role-arn", required=False, type=str)
 @click.option("--create-missing-services", default=False, type=bool)
+@click.option("--workers", default=1, type=click.IntRange(min=1))
+@click.option("--worker-type", default="thread", type=click.Choice(WORKER_TYPES))
+@click.option("--cache-dir", required=False, type=click.Path(file_okay=False))
+@click.option("--log-format", default="text", type=click.Choice(LOG_FORMATS))
+@click.option("--profile", "profile_prefix", required=False, type=click.Path())
+@click.option("--history", "history_path", required=False, type=click.Path())
 def main(
-    config, var, output_path, dry_run, role_arn=None, create_missing_services=False
+    config,
+    var,
+    output_path,
+    dry_run,
+    manifest_path=None,
+    role_arn=None,
+    create_missing_services=False,
+    workers=1,
+    worker_type="thread",
+    cache_dir=None,
+    log_format="text",
+    profile_prefix=None,
+    history_path=None,
 ):
+    configure_logging(log_format)
+    context = (
+        profiling.profile(profile_prefix)
+        if profile_prefix
+        else contextlib.nullcontext()
+    )
     try:
-        run(
-            filename=config,
-            template_vars=dict(var),
+        with context:
+            run(
+                filename=config,
+                template_vars=dict(var),
+                role_arn=role_arn,
+                output_path=output_path,
+                manifest_path=manifest_path,
+                create_missing_services=create_missing_services,
+                dry_run=dry_run,
+                workers=workers,
+                worker_type=worker_type,
+                cache_dir=cache_dir,
+                history_path=history_path,
+            )
+    except DeploymentFailed:
+        sys.exit(1)
+
+
+def run(
+    filename: str,
+    template_vars: typing.Dict[str, str],
+    role_arn: typing.Optional[str] = None,
+    output_path: typing.Optional[str] = None,
+    manifest_path: typing.Optional[str] = None,
+    create_missing_services=False,
+    dry_run=False,
+    workers: int = 1,
+    worker_type: str = "thread",
+    cache_dir: typing.Optional[str] = None,
+    history_path: typing.Optional[str] = None,
+):
+    history = History(history_path) if history_path else None
+    try:
+        deploy(
+            filename,
+            template_vars,
             role_arn=role_arn,
             output_path=output_path,
+            manifest_path=manifest_path,
             create_missing_services=create_missing_services,
             dry_run=dry_run,
+            workers=workers,
+            worker_type=worker_type,
+            cache_dir=cache_dir,
+            history=history,
         )
+    except ValidationError as exc:
+        _log_validation_errors(exc)
+        sys.exit(1)
     except DeploymentFailed:
+        logger.exception("Error, exiting")
         sys.exit(1)
+    finally:
+        if history is not None:
+            history.close()
 
 
-def run(
+def deploy(
     filename: str,
     template_vars: typing.Dict[str, str],
     role_arn: typing.Optional[str] = None,
     output_path: typing.Optional[str] = None,
+    manifest_path: typing.Optional[str] = None,
     create_missing_services=False,
     dry_run=False,
-):
+    workers: int = 1,
+    worker_type: str = "thread",
+    cache_dir: typing.Optional[str] = None,
+    connection: typing.Optional[Connection] = None,
+    template_cache: typing.Optional[TemplateCache] = None,
+    history: typing.Optional[History] = None,
+) -> typing.Dict[str, TaskDefinition]:
+    """Deploy the given config file, see `run()`.
+
+    Unlike `run()` errors are raised instead of exiting the process, and an
+    existing connection, template cache and history can be passed.
+
+    :raises ValidationError: when the config or task definitions are invalid
+    :raises DeploymentFailed: when the deployment failed
+    """
     base_path = os.path.dirname(filename)
-    with open(filename, "r") as fh:
-        config = yaml.safe_load(fh.read())
+    config = load_config(filename)
+    validate_config(config)
 
-    connection = Connection(role_arn)
+    if connection is None:
+        connection = Connection(role_arn)
     cluster_name = config["cluster_name"]
     services = config["services"]
     logger.info(
-        "Starting deploy on cluster %s (%s services)", cluster_name, len(services)
+        "Starting deploy on cluster %s (%s services)",
+        cluster_name,
+        len(services),
+        extra={"phase": "start", "cluster": cluster_name},
     )
 
     # Generate the task definitions
     task_definitions = generate_task_definitions(
-        config, template_vars, base_path, output_path
+        config,
+        template_vars,
+        base_path,
+        output_path,
+        template_cache=template_cache,
+        workers=workers,
+        worker_type=worker_type,
+        cache=GenerationCache(cache_dir) if cache_dir else None,
     )
+    if manifest_path:
+        write_manifest(task_definitions, manifest_path)
 
-    # Check if all task definitions required by the services exists
-    for service_name, service in services.items():
-        if service["task_definition"] not in task_definitions:
-            logger.error(
-                "Missing task definition %r for service %r",
-                service["task_definition"],
-                service_name,
-            )
+    # Validate the task definitions before registering any of them
+    validate_task_definitions(
+        config, task_definitions, connection.ecs.meta.service_model
+    )
 
     # Run the deployment
     if not dry_run:
+        start_deployment(
+            config,
+            connection,
+            task_definitions,
+            create_missing_services,
+            history=history,
+        )
+    return task_definitions
+
+
+@click.command()
+@click.option("--config", "configs", required=True, multiple=True, type=click.Path())
+@click.option("--var", multiple=True, type=VarType())
+@click.option("--dry-run", is_flag=True, default=False)
+@click.option("--role-arn", required=False, type=str)
+@click.option("--create-missing-services", default=False, type=bool)
+@click.option("--concurrency", default=4, type=click.IntRange(min=1))
+@click.option("--cache-dir", required=False, type=click.Path(file_okay=False))
+@click.option("--log-format", default="text", type=click.Choice(LOG_FORMATS))
+@click.option("--history", "history_path", required=False, type=click.Path())
+def batch(
+    configs,
+    var,
+    dry_run,
+    role_arn=None,
+    create_missing_services=False,
+    concurrency=4,
+    cache_dir=None,
+    log_format="text",
+    history_path=None,
+):
+    """Deploy multiple config files concurrently in one process."""
+    configure_logging(log_format)
+    results = run_batch(
+        filenames=configs,
+        template_vars=dict(var),
+        role_arn=role_arn,
+        create_missing_services=create_missing_services,
+        dry_run=dry_run,
+        concurrency=concurrency,
+        cache_dir=cache_dir,
+        history_path=history_path,
+    )
+    if any(result.error for result in results):
+        sys.exit(1)
+
+
+class BatchResult(typing.NamedTuple):
+    filename: str
+    duration: float
+    error: typing.Optional[str] = None
+
+
+def run_batch(
+    filenames: typing.Sequence[str],
+    template_vars: typing.Dict[str, str],
+    role_arn: typing.Optional[str] = None,
+    create_missing_services=False,
+    dry_run=False,
+    concurrency: int = 4,
+    cache_dir: typing.Optional[str] = None,
+    history_path: typing.Optional[str] = None,
+) -> typing.List[BatchResult]:
+    """Deploy the config files with at most `concurrency` at the same time.
+
+    All deployments share the connection, the template cache and the history.
+    Returns the result per config file, in the given order, after logging a
+    report.
+    """
+    connection = get_connection(role_arn)
+    template_cache = TemplateCache()
+    history = History(history_path) if history_path else None
+
+    def run_one(filename: str) -> BatchResult:
+        start_time = time.monotonic()
         try:
-            start_deployment(
-                config, connection, task_definitions, create_missing_services
+            deploy(
+                filename,
+                template_vars,
+                create_missing_services=create_missing_services,
+                dry_run=dry_run,
+                cache_dir=cache_dir,
+                connection=connection,
+                template_cache=template_cache,
+                history=history,
             )
-        except DeploymentFailed:
-            logger.exception("Error, exiting")
-            sys.exit(1)
+        except ValidationError as exc:
+            error = "invalid configuration: %s" % "; ".join(exc.errors)
+        except Exception as exc:
+            logger.exception("Deployment of %s failed", filename)
+            error = str(exc) or exc.__class__.__name__
+        else:
+            error = None
+        return BatchResult(filename, time.monotonic() - start_time, error)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(run_one, filenames))
+    finally:
+        if history is not None:
+            history.close()
+
+    num_failed = sum(1 for result in results if result.error)
+    logger.info(
+        "Deployed %d configs: %d succeeded, %d failed",
+        len(results),
+        len(results) - num_failed,
+        num_failed,
+    )
+    for result in results:
+        if result.error:
+            logger.info(
+                " - %s: failed after %.1fs (%s)",
+                result.filename,
+                result.duration,
+                result.error,
+            )
+        else:
+            logger.info(" - %s: succeeded in %.1fs", result.filename, result.duration)
+    return results
+
+
+def _log_validation_errors(exc: ValidationError) -> None:
+    logger.error("Invalid configuration, exiting")
+    for error in exc.errors:
+        logger.error(" - %s", error)
@@ -0,0 +1,85 @@
+import copy
+import hashlib
+import os.path
+import typing
+
+import yaml
+
+# Use the (much faster) libyaml based loader when available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader  # type: ignore
+
+# Dependencies are the (path, sha256) of the file and all files it includes
+Dependencies = typing.Tuple[typing.Tuple[str, str], ...]
+
+# Parsed files by absolute path, shared by all configs loaded in this process
+_cache: typing.Dict[str, typing.Tuple[Dependencies, typing.Any]] = {}
+
+
+class ConfigLoader(SafeLoader):
+    """YAML loader supporting `!include <filename>`.
+
+    The filename is relative to the file containing the `!include`, and the
+    value is replaced by the contents of the included file.
+    """
+
+    path: str
+    stack: typing.Tuple[str, ...]
+    dependencies: typing.List[typing.Tuple[str, str]]
+
+
+def _include(loader: ConfigLoader, node: yaml.Node) -> typing.Any:
+    filename = os.path.join(os.path.dirname(loader.path), loader.construct_scalar(node))
+    dependencies, data = _load(os.path.abspath(filename), loader.stack)
+    loader.dependencies.extend(dependencies)
+    return copy.deepcopy(data)
+
+
+ConfigLoader.add_constructor("!include", _include)
+
+
+def load_config(filename: str) -> typing.Any:
+    """Load the YAML config file.
+
+    Parsed files are cached for the lifetime of the process, keyed by path and
+    validated against the sha256 of their content (and of the files they
+    include). Every call returns a new copy of the data.
+    """
+    dependencies, data = _load(os.path.abspath(filename), ())
+    return copy.deepcopy(data)
+
+
+def _load(
+    path: str, stack: typing.Tuple[str, ...]
+) -> typing.Tuple[Dependencies, typing.Any]:
+    if path in stack:
+        raise ValueError("Recursive !include of %s" % path)
+
+    entry = _cache.get(path)
+    if entry is not None and all(_digest(p) == digest for p, digest in entry[0]):
+        return entry
+
+    with open(path, "rb") as fh:
+        content = fh.read()
+
+    loader = ConfigLoader(content)
+    loader.path = path
+    loader.stack = stack + (path,)
+    loader.dependencies = [(path, hashlib.sha256(content).hexdigest())]
+    try:
+        data = loader.get_single_data()
+    finally:
+        loader.dispose()
+
+    entry = _cache[path] = (tuple(dict.fromkeys(loader.dependencies)), data)
+    return entry
+
+
+def _digest(path: str) -> typing.Optional[str]:
+    try:
+        with open(path, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+    except FileNotFoundError:
+        return None
@@ -1,9 +1,39 @@
+import functools
+import threading
+import time
+import typing
+
 import boto3
 from botocore.config import Config
 
+_connections: typing.Dict[typing.Optional[str], "Connection"] = {}
+_connections_lock = threading.Lock()
+
+# Credentials of an assumed role expire after an hour by default
+MAX_CONNECTION_AGE = 45 * 60
+
+
+def get_connection(role_arn: typing.Optional[str] = None) -> "Connection":
+    """Return a shared connection for the role.
+
+    Creating a connection assumes the role and creates the clients, so
+    processes doing multiple deployments should reuse them. The clients
+    are thread-safe. Connections for a role are recreated before the
+    credentials expire.
+    """
+    with _connections_lock:
+        connection = _connections.get(role_arn)
+        if connection is None or (
+            role_arn and time.monotonic() - connection.created > MAX_CONNECTION_AGE
+        ):
+            connection = _connections[role_arn] = Connection(role_arn)
+        return connection
+
 
 class Connection:
     def __init__(self, role_arn=None):
+        self.role_arn = role_arn
+        self.created = time.monotonic()
         credentials = {}
         if role_arn:
             sts = boto3.client("sts")
@@ -21,3 +51,46 @@ class Connection:
 
         self.ecs = boto3.client("ecs", config=config, **credentials)
         self.events = boto3.client("events", config=config, **credentials)
+
+        self._config = config
+        self._credentials = credentials
+        self._clients: typing.Dict[
+            typing.Tuple[str, typing.Optional[str]], typing.Any
+        ] = {}
+        self._clients_lock = threading.Lock()
+
+    # The clients below are only used by optional features, so they are
+    # created on first use to keep the startup fast
+    @functools.cached_property
+    def s3(self):
+        return self._client("s3")
+
+    @functools.cached_property
+    def elbv2(self):
+        return self._client("elbv2")
+
+    @functools.cached_property
+    def ecr(self):
+        return self._client("ecr")
+
+    @functools.cached_property
+    def ssm(self):
+        return self._client("ssm")
+
+    @functools.cached_property
+    def secretsmanager(self):
+        return self._client("secretsmanager")
+
+    def regional_client(self, service_name: str, region_name: str):
+        """Return a client for a region other than the default region."""
+        return self._client(service_name, region_name)
+
+    def _client(self, service_name: str, region_name: typing.Optional[str] = None):
+        key = (service_name, region_name)
+        with self._clients_lock:
+            if key not in self._clients:
+                kwargs = {"region_name": region_name} if region_name else {}
+                self._clients[key] = boto3.client(
+                    service_name, config=self._config, **kwargs, **self._credentials
+                )
+            return self._clients[key]
@@ -1,21 +1,36 @@
 #!/usr/bin/env python
 import datetime
-import sys
 import time
 import typing
 
 import pytz
 
-from ecs_deplojo import utils
+from ecs_deplojo import capacity, utils
 from ecs_deplojo.connection import Connection
+from ecs_deplojo.environment_files import offload_environments
 from ecs_deplojo.exceptions import DeploymentFailed
+from ecs_deplojo.history import (
+    DEFAULT_TIMEOUT,
+    History,
+    Run,
+    format_duration,
+    record_run,
+)
+from ecs_deplojo.images import pin_image_digests
 from ecs_deplojo.logger import logger
+from ecs_deplojo.readiness import TargetHealth
 from ecs_deplojo.register import (
     deregister_task_definitions,
     register_task_definitions,
+    update_discovered_rules,
     update_scheduled_tasks,
 )
-from ecs_deplojo.task_definitions import TaskDefinition
+from ecs_deplojo.secret_references import check_secrets
+from ecs_deplojo.task_definitions import TaskDefinition, payload_digest
+from ecs_deplojo.watcher import ServiceDeploymentsWatcher, supports_service_deployments
+
+# How often the full service documents are requested with lightweight polling
+FULL_REFRESH_INTERVAL = 30
 
 
 def start_deployment(
@@ -23,88 +38,386 @@ def start_deployment(
     connection: Connection,
     task_definitions: typing.Dict[str, TaskDefinition],
     create_missing_services: bool = False,
+    history: typing.Optional[History] = None,
 ) -> None:
     """Start the deployment.
 
     The following steps are executed:
 
-    1. Check if all services defined in the task definitions exist
-    2. The task definitions are registered with AWS
+    1. Check if all services defined in the task definitions exist, and
+       optionally if the secrets they reference exist
+    2. The task definitions are registered with AWS, optionally after pinning
+       the images to their digest and moving the environment variables to S3
     3. The before_deploy tasks are started
     4. The services are updated to reference the last task definitions
     5. The client poll's AWS until all deployments are finished.
     6. The after_deploy tasks are started.
 
+    When the config sets `skip_unchanged_services: true` the services which
+    already run a task definition identical to the generated one are not
+    updated and not waited for, see `reuse_task_definitions()`.
+
+    When a `history` is given the run is recorded in it, including the time
+    it took for every service to become stable.
     """
     cluster_name = config["cluster_name"]
     services = config["services"]
 
     # Before doing anything, lets check if we need to create new services. By
     # default we don't do that anymore (terraform should be used)
-    new_services = utils.find_missing_services(
+    live_services = utils.describe_services(
         connection.ecs, cluster=cluster_name, services=set(services.keys())
     )
+    new_services = set(services) - {s["serviceName"] for s in live_services}
     if not create_missing_services and new_services:
         names = ", ".join(new_services)
         raise DeploymentFailed("The following services are missing: %s" % names)
 
-    # Register the task definitions in ECS
-    register_task_definitions(connection, task_definitions)
+    with record_run(history, cluster_name) as run:
+        # Check that the referenced secrets exist before changing anything
+        if config.get("check_secrets"):
+            check_secrets(connection, task_definitions)
+
+        # Replace the image tags by their digests when configured
+        if config.get("pin_image_digests"):
+            pin_image_digests(connection, task_definitions)
+
+        # Move the environment variables to S3 when configured
+        environment_files = config.get("environment_files")
+        if environment_files:
+            offload_environments(
+                connection,
+                task_definitions,
+                bucket=environment_files["bucket"],
+                prefix=environment_files.get("prefix", ""),
+            )
 
-    # update the task-definition arns on scheduled tasks
-    scheduled_tasks = config.get("scheduled_tasks", {})
-    update_scheduled_tasks(connection, task_definitions, scheduled_tasks)
+        # Register the task definitions in ECS, unless the services already
+        # run an identical one
+        reused: typing.Set[str] = set()
+        if config.get("skip_unchanged_services"):
+            reused = reuse_task_definitions(
+                connection, services, task_definitions, live_services
+            )
+        register_task_definitions(
+            connection,
+            {k: v for k, v in task_definitions.items() if k not in reused},
+        )
+        if run is not None:
+            for service_name, service in services.items():
+                task_definition = task_definitions[service["task_definition"]]
+                run.set_task_definition(
+                    service_name, task_definition.name, task_definition.digest()
+                )
+
+        # update the task-definition arns on scheduled tasks
+        scheduled_tasks = config.get("scheduled_tasks", {})
+        update_scheduled_tasks(connection, task_definitions, scheduled_tasks)
+        if config.get("discover_scheduled_tasks"):
+            update_discovered_rules(
+                connection,
+                cluster_name,
+                task_definitions,
+                exclude=scheduled_tasks.keys(),
+            )
 
-    # Run tasks before deploying services
-    tasks_before_deploy = config.get("before_deploy", [])
-    run_tasks(connection, cluster_name, task_definitions, tasks_before_deploy)
+        # Run tasks before deploying services
+        tasks_before_deploy = config.get("before_deploy", [])
+        run_tasks(connection, cluster_name, task_definitions, tasks_before_deploy)
+
+        # Update services
+        changed_services = _changed_services(services, task_definitions, live_services)
+        readiness = config.get("readiness", "deployments")
+        lightweight_polling = bool(config.get("lightweight_polling"))
+        if not changed_services:
+            is_finished = True
+        elif config.get("capacity_aware_rollout"):
+            is_finished = rollout_by_capacity(
+                connection,
+                cluster_name,
+                changed_services,
+                task_definitions,
+                new_services,
+                readiness=readiness,
+                run=run,
+                lightweight_polling=lightweight_polling,
+            )
+        else:
+            for service_name, service in changed_services.items():
+                task_definition = task_definitions[service["task_definition"]]
+                update_service(
+                    connection,
+                    cluster_name,
+                    service_name,
+                    task_definition,
+                    create=service_name in new_services,
+                )
+            is_finished = wait_for_deployments(
+                connection,
+                cluster_name,
+                changed_services.keys(),
+                readiness=readiness,
+                run=run,
+                lightweight_polling=lightweight_polling,
+            )
+
+        if not is_finished:
+            raise DeploymentFailed("Timeout")
+
+        # Run tasks after deploying services
+        tasks_after_deploy = config.get("after_deploy", [])
+        run_tasks(connection, cluster_name, task_definitions, tasks_after_deploy)
+
+        # Deregister old task definitions
+        deregister_task_definitions(connection, task_definitions)
+
+
+def reuse_task_definitions(
+    connection: Connection,
+    services: typing.Dict[str, typing.Any],
+    task_definitions: typing.Dict[str, TaskDefinition],
+    live_services: typing.List[typing.Dict[str, typing.Any]],
+) -> typing.Set[str]:
+    """Use the task definitions the services currently run instead of
+    registering a new revision when they are identical to the generated ones.
+
+    The task definitions are compared by their digest, see
+    `TaskDefinition.digest()`. Returns the names of the reused task
+    definitions.
+    """
+    live_arns = {s["serviceName"]: s["taskDefinition"] for s in live_services}
+    described: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    digests: typing.Dict[str, str] = {}
+    reused = set()
 
-    # Update services
+    for service_name, service in services.items():
+        name = service["task_definition"]
+        arn = live_arns.get(service_name)
+        if not arn or name in reused:
+            continue
+
+        if arn not in described:
+            response = connection.ecs.describe_task_definition(taskDefinition=arn)
+            described[arn] = response["taskDefinition"]
+        if name not in digests:
+            digests[name] = task_definitions[name].digest()
+        live = described[arn]
+        if payload_digest(live) != digests[name]:
+            continue
+
+        task_definition = task_definitions[name]
+        task_definition.family = live["family"]
+        task_definition.revision = live["revision"]
+        task_definition.name = "%s:%s" % (live["family"], live["revision"])
+        task_definition.arn = live["taskDefinitionArn"]
+        reused.add(name)
+        logger.info(
+            "Task definition %s is unchanged",
+            task_definition,
+            extra={"phase": "register", "task_definition": task_definition.name},
+        )
+    return reused
+
+
+def _changed_services(
+    services: typing.Dict[str, typing.Any],
+    task_definitions: typing.Dict[str, TaskDefinition],
+    live_services: typing.List[typing.Dict[str, typing.Any]],
+) -> typing.Dict[str, typing.Any]:
+    """Return the services which don't run their task definition yet."""
+    live_arns = {s["serviceName"]: s["taskDefinition"] for s in live_services}
+    result = {}
     for service_name, service in services.items():
         task_definition = task_definitions[service["task_definition"]]
-        if service_name in new_services:
+        if live_arns.get(service_name) == task_definition.arn:
             logger.info(
-                "Creating new service %s with task definition %s",
+                "Service %s already runs %s, skipping",
                 service_name,
                 task_definition.name,
-            )
-            connection.ecs.create_service(
-                cluster=cluster_name,
-                serviceName=service_name,
-                desiredCount=1,
-                taskDefinition=task_definition.arn,
+                extra={
+                    "phase": "update",
+                    "service": service_name,
+                    "task_definition": task_definition.name,
+                },
             )
         else:
-            logger.info(
-                "Updating service %s with task definition %s",
-                service_name,
-                task_definition.name,
-            )
-            connection.ecs.update_service(
-                cluster=cluster_name,
-                service=service_name,
-                taskDefinition=task_definition.arn,
-            )
+            result[service_name] = service
+    return result
+
 
-    is_finished = wait_for_deployments(connection, cluster_name, services.keys())
+def update_service(
+    connection: Connection,
+    cluster_name: str,
+    service_name: str,
+    task_definition: TaskDefinition,
+    create: bool = False,
+) -> None:
+    """Create the service or update it to use the task definition."""
+    extra = {
+        "phase": "update",
+        "service": service_name,
+        "task_definition": task_definition.name,
+    }
+    if create:
+        logger.info(
+            "Creating new service %s with task definition %s",
+            service_name,
+            task_definition.name,
+            extra=extra,
+        )
+        connection.ecs.create_service(
+            cluster=cluster_name,
+            serviceName=service_name,
+            desiredCount=1,
+            taskDefinition=task_definition.arn,
+        )
+    else:
+        logger.info(
+            "Updating service %s with task definition %s",
+            service_name,
+            task_definition.name,
+            extra=extra,
+        )
+        connection.ecs.update_service(
+            cluster=cluster_name,
+            service=service_name,
+            taskDefinition=task_definition.arn,
+        )
 
-    if not is_finished:
-        raise DeploymentFailed("Timeout")
 
-    # Run tasks after deploying services
-    tasks_after_deploy = config.get("after_deploy", [])
-    run_tasks(connection, cluster_name, task_definitions, tasks_after_deploy)
+def rollout_by_capacity(
+    connection: Connection,
+    cluster_name: str,
+    services: typing.Dict[str, typing.Any],
+    task_definitions: typing.Dict[str, TaskDefinition],
+    new_services: typing.Set[str],
+    readiness: str = "deployments",
+    run: typing.Optional[Run] = None,
+    lightweight_polling: bool = False,
+) -> bool:
+    """Update the services in batches which fit in the free capacity of the
+    cluster.
+
+    Before every batch the remaining cpu and memory of the container
+    instances is sampled, and the services are selected (in config order)
+    for which the extra tasks of the rolling update can be placed, see
+    `capacity.plan_batch()`. The next batch starts when the deployments of
+    the previous batch are finished.
+    """
+    existing = {
+        service["serviceName"]: service
+        for service in utils.describe_services(
+            connection.ecs,
+            cluster=cluster_name,
+            services=set(services) - set(new_services),
+        )
+    }
+    sizes = {
+        name: capacity.task_size(task_definitions[service["task_definition"]])
+        for name, service in services.items()
+    }
+
+    pending = list(services)
+    while pending:
+        requests = [
+            (
+                name,
+                sizes[name],
+                # New services are created with a single task
+                capacity.surge_tasks(existing[name]) if name in existing else 1,
+            )
+            for name in pending
+        ]
+        batch, pending = capacity.plan_batch(
+            requests, capacity.sample_capacity(connection, cluster_name)
+        )
+        if pending:
+            logger.info(
+                "Updating %s, waiting with %s until there is capacity",
+                ", ".join(batch),
+                ", ".join(pending),
+                extra={"phase": "update"},
+            )
 
-    # Deregister old task definitions
-    deregister_task_definitions(connection, task_definitions)
+        for name in batch:
+            update_service(
+                connection,
+                cluster_name,
+                name,
+                task_definitions[services[name]["task_definition"]],
+                create=name in new_services,
+            )
+        if not wait_for_deployments(
+            connection,
+            cluster_name,
+            batch,
+            readiness=readiness,
+            run=run,
+            lightweight_polling=lightweight_polling,
+        ):
+            return False
+    return True
 
 
 def wait_for_deployments(
-    connection: Connection, cluster_name: str, service_names: typing.List[str]
+    connection: Connection,
+    cluster_name: str,
+    service_names: typing.Iterable[str],
+    readiness: str = "deployments",
+    run: typing.Optional[Run] = None,
+    lightweight_polling: bool = False,
 ) -> bool:
-    """Poll ECS until all deployments are finished (status = PRIMARY)"""
-    logger.info("Waiting for deployments")
+    """Poll ECS until all deployments are finished (status = PRIMARY)
+
+    With the `target_health` readiness the services are done as soon as the
+    targets of their new tasks are healthy in the target groups, see
+    `TargetHealth`.
+
+    With `lightweight_polling` (and the default readiness) the rollouts are
+    tracked via the service deployments API, see
+    `ServiceDeploymentsWatcher`. The full service documents, with the
+    events, are then only requested every 30 seconds and at the end.
+
+    With the `run` of a history the expected duration of the services is
+    logged, the timeout per service is based on the previous durations and
+    the time it took for every service to become stable is recorded.
+    """
+    logger.info("Waiting for deployments", extra={"phase": "wait"})
     start_time = time.time()
+    service_names = list(service_names)
+    stable_after: typing.Dict[str, float] = {}
+    estimates: typing.Dict[str, float] = {}
+    timeouts = {name: float(DEFAULT_TIMEOUT) for name in service_names}
+    if run is not None:
+        for name in service_names:
+            estimate = run.estimate(name)
+            if estimate is not None:
+                estimates[name] = estimate
+            timeouts[name] = run.timeout(name)
+        if estimates:
+            logger.info(
+                "Expected time until stable: %s",
+                ", ".join(
+                    "%s %s" % (name, format_duration(estimate))
+                    for name, estimate in estimates.items()
+                ),
+                extra={"phase": "wait"},
+            )
+
+    target_health = None
+    if readiness == "target_health":
+        target_health = TargetHealth(connection, cluster_name)
+
+    watcher = None
+    if lightweight_polling and target_health is None:
+        if supports_service_deployments(connection):
+            watcher = ServiceDeploymentsWatcher(connection, cluster_name, service_names)
+        else:
+            logger.warning(
+                "The service deployments API is not supported by this version "
+                "of boto3, polling the services instead",
+                extra={"phase": "wait"},
+            )
 
     def service_description(service):
         """Return string in format of 'name (0/2)'"""
@@ -121,7 +434,8 @@ def wait_for_deployments(
         return name
 
     # Wait till all service updates are deployed
-    time.sleep(5)
+    if target_health is None:
+        time.sleep(5)
 
     utc_timestamp = datetime.datetime.utcnow().replace(
         tzinfo=pytz.utc
@@ -130,31 +444,70 @@ def wait_for_deployments(
     logged_message_ids: typing.Set[str] = set()
     ready_timestamp = None
     last_message = datetime.datetime.now()
+    services: typing.List[typing.Dict[str, typing.Any]] = []
+    last_refresh = 0.0
 
     while True:
-        services = utils.describe_services(
-            connection.ecs, cluster=cluster_name, services=service_names
-        )
+        refresh = watcher is None or time.time() - last_refresh >= FULL_REFRESH_INTERVAL
+        if refresh:
+            services = utils.describe_services(
+                connection.ecs, cluster=cluster_name, services=service_names
+            )
+            last_refresh = time.time()
+
+        if target_health is not None:
+            ready = target_health.ready_services(services)
+            in_progress = [s for s in services if s["serviceName"] not in ready]
+        elif watcher is not None:
+            active = watcher.in_progress()
+            in_progress = [s for s in services if s["serviceName"] in active]
+            if not in_progress and not refresh:
+                # Get the final state and the last events of the services
+                services = utils.describe_services(
+                    connection.ecs, cluster=cluster_name, services=service_names
+                )
+                refresh = True
+        else:
+            in_progress = [s for s in services if len(s["deployments"]) > 1]
 
-        in_progress = [s for s in services if len(s["deployments"]) > 1]
+        in_progress_names = {s["serviceName"] for s in in_progress}
+        for name in service_names:
+            if name not in in_progress_names and name not in stable_after:
+                stable_after[name] = time.time() - start_time
 
         messages = extract_new_event_messages(
-            services, last_event_timestamps, logged_message_ids
+            services if refresh else [], last_event_timestamps, logged_message_ids
         )
-        for message in messages:
+        for service_name, message in messages:
             logger.info(
-                "%s - %s", message["createdAt"].strftime("%H:%M:%S"), message["message"]
+                "%s - %s",
+                message["createdAt"].strftime("%H:%M:%S"),
+                message["message"],
+                extra={
+                    "phase": "wait",
+                    "service": service_name,
+                    "event_id": message["id"],
+                    "event_time": message["createdAt"].isoformat(),
+                },
             )
             last_message = datetime.datetime.now()
 
         # 5 Seconds after the deployment is no longer in progress we mark it
-        # as done.
+        # as done. Healthy targets don't need the grace period.
         offset = datetime.datetime.utcnow() - datetime.timedelta(seconds=5)
-        if ready_timestamp and offset > ready_timestamp:
+        if (ready_timestamp and offset > ready_timestamp) or (
+            target_health is not None and not in_progress
+        ):
             logger.info(
                 "Deployment finished: %s",
                 ", ".join([service_description(s) for s in services]),
+                extra={"phase": "wait", "duration": round(time.time() - start_time, 3)},
             )
+            if run is not None:
+                for name in service_names:
+                    run.record_service(
+                        name, stable_after.get(name, time.time() - start_time), "stable"
+                    )
             break
 
         # Set is_ready after the previous check so that we can wait for x
@@ -164,21 +517,53 @@ def wait_for_deployments(
 
         # So we haven't printed something for a while, let's give some feedback
         elif last_message < datetime.datetime.now() - datetime.timedelta(seconds=10):
+            elapsed = time.time() - start_time
             logger.info(
                 "Still waiting for: %s",
-                ", ".join([s["serviceName"] for s in in_progress]),
+                ", ".join(
+                    [
+                        _waiting_description(s["serviceName"], estimates, elapsed)
+                        for s in in_progress
+                    ]
+                ),
+                extra={"phase": "wait"},
             )
 
         time.sleep(5)
-        if time.time() - start_time > (60 * 15):
-            logger.error("Giving up after 15 minutes")
+        elapsed = time.time() - start_time
+        timed_out = [
+            s["serviceName"]
+            for s in in_progress
+            if elapsed > timeouts.get(s["serviceName"], DEFAULT_TIMEOUT)
+        ]
+        if timed_out:
+            logger.error(
+                "Giving up on %s after %s",
+                ", ".join(timed_out),
+                format_duration(elapsed),
+                extra={"phase": "wait", "duration": round(elapsed, 3)},
+            )
+            if run is not None:
+                for name in timed_out:
+                    run.record_service(name, elapsed, "timeout")
             return False
     return True
 
 
+def _waiting_description(
+    name: str, estimates: typing.Dict[str, float], elapsed: float
+) -> str:
+    """Return the service name, with the expected remaining time if known."""
+    remaining = estimates.get(name, 0) - elapsed
+    if remaining < 1:
+        return name
+    return "%s (~%s left)" % (name, format_duration(remaining))
+
+
 def extract_new_event_messages(
     services, last_timestamps, logged_message_ids
-) -> typing.Generator[typing.Dict[str, typing.Any], None, None]:
+) -> typing.Generator[typing.Tuple[str, typing.Dict[str, typing.Any]], None, None]:
+    """Yield the (service name, event) of the events which weren't logged yet."""
     for service in services:
         events = []
         for event in service["events"]:
@@ -187,7 +572,7 @@ def extract_new_event_messages(
 
         for event in reversed(events):
             if event["id"] not in logged_message_ids:
-                yield event
+                yield service["serviceName"], event
                 logged_message_ids.add(event["id"])
 
         # Keep track of the timestamp of the last event
@@ -218,6 +603,7 @@ def run_tasks(connection, cluster_name, task_definitions, tasks) -> None:
             task["command"],
             task_def.name,
             task["container"],
+            extra={"phase": "one-off", "task_definition": task_def.name},
         )
 
         response = connection.ecs.run_task(
@@ -232,12 +618,16 @@ def run_tasks(connection, cluster_name, task_definitions, tasks) -> None:
             count=1,
         )
         if response.get("failures"):
-            logger.error("Error starting one-off task: %r", response["failures"])
+            logger.error(
+                "Error starting one-off task: %r",
+                response["failures"],
+                extra={"phase": "one-off", "task_definition": task_def.name},
+            )
 
             # If we already started one task then we keep retrying until
             # the previous task is finished.
             if num > 0 and num <= 30:
                 time.sleep(5)
             else:
-                sys.exit(1)
+                raise DeploymentFailed("Error starting one-off task")
         num += 1
@@ -0,0 +1,132 @@
+import collections.abc
+import operator
+import typing
+from string import Template
+
+from ecs_deplojo.exceptions import ValidationError
+
+
+def substitute(
+    template: Template, variables: typing.Mapping[str, str], location: str
+) -> str:
+    """Substitute the variables in the template.
+
+    :raises ValidationError: for unknown variables and invalid placeholders,
+        the `location` is used in the error message
+    """
+    try:
+        return template.substitute(variables)
+    except KeyError as exc:
+        raise ValidationError(["%s: unknown variable $%s" % (location, exc.args[0])])
+    except ValueError as exc:
+        # Don't include the value in the message, it could be a password
+        raise ValidationError(
+            ["%s: %s, use $$ for a literal $" % (location, str(exc).lower())]
+        )
+
+
+class Environment(collections.abc.Mapping):
+    """Read-only mapping of environment variables built out of layers.
+
+    The layers are merged in order (global -> group -> overrides), so later
+    layers take precedence. Merging only happens when the mapping is first
+    read, and since an Environment is never modified after creation a single
+    instance is shared by all containers and task definitions using the same
+    combination of layers. This also means that the (sorted) list used in the
+    boto3 payload is only built once per combination.
+
+    """
+
+    def __init__(self, *layers: typing.Mapping[str, typing.Any]):
+        self._layers = tuple(dict(layer) for layer in layers if layer)
+        self._resolved: typing.Optional[typing.Dict[str, typing.Any]] = None
+        self._lists: typing.Dict[str, typing.List[typing.Dict[str, str]]] = {}
+        self._templates: typing.Optional[typing.List[tuple]] = None
+        self._substituted: typing.Dict[tuple, "Environment"] = {}
+
+    def with_layer(self, layer: typing.Mapping[str, typing.Any]) -> "Environment":
+        """Return a new Environment with the given layer on top of this one."""
+        if not layer:
+            return self
+        return Environment(*self._layers, layer)
+
+    def substitute(self, variables: typing.Mapping[str, str]) -> "Environment":
+        """Return an Environment with the template variables in the values
+        replaced.
+
+        Only values containing a `$` are interpolated and the result is
+        remembered per set of variables.
+        """
+        if self._templates is None:
+            self._templates = [
+                (k, Template(v))
+                for k, v in self._resolve().items()
+                if isinstance(v, str) and "$" in v
+            ]
+        if not self._templates:
+            return self
+
+        key = tuple(sorted(variables.items()))
+        result = self._substituted.get(key)
+        if result is None:
+            result = self._substituted[key] = self.with_layer(
+                {
+                    k: substitute(template, variables, k)
+                    for k, template in self._templates
+                }
+            )
+        return result
+
+    def as_list(self, value_key: str = "value") -> typing.List[typing.Dict[str, str]]:
+        """Return the variables in the format used by boto3, sorted by name.
+
+        The result is computed once and shared, so it should not be modified.
+        """
+        result = self._lists.get(value_key)
+        if result is None:
+            result = self._lists[value_key] = sorted(
+                [{"name": k, value_key: str(v)} for k, v in self._resolve().items()],
+                key=operator.itemgetter("name"),
+            )
+        return result
+
+    def _resolve(self) -> typing.Dict[str, typing.Any]:
+        if self._resolved is None:
+            resolved: typing.Dict[str, typing.Any] = {}
+            for layer in self._layers:
+                resolved.update(layer)
+            self._resolved = resolved
+        return self._resolved
+
+    def __getitem__(self, key: str) -> typing.Any:
+        return self._resolve()[key]
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._resolve())
+
+    def __len__(self) -> int:
+        return len(self._resolve())
+
+    def __copy__(self) -> "Environment":
+        return self
+
+    def __deepcopy__(self, memo) -> "Environment":
+        return self
+
+    def __repr__(self):
+        return "Environment(%r)" % self._resolve()
+
+
+def as_list(
+    mapping: typing.Mapping[str, typing.Any], value_key: str = "value"
+) -> typing.List[typing.Dict[str, str]]:
+    """Convert a mapping of variables to the list format used by boto3.
+
+    For an `Environment` the shared (memoized) list is returned.
+    """
+    if isinstance(mapping, Environment):
+        return mapping.as_list(value_key)
+    return sorted(
+        [{"name": k, value_key: str(v)} for k, v in mapping.items()],
+        key=operator.itemgetter("name"),
+    )
@@ -0,0 +1,101 @@
+import hashlib
+import typing
+
+from botocore.exceptions import ClientError
+
+from ecs_deplojo.connection import Connection
+from ecs_deplojo.environment import Environment
+from ecs_deplojo.logger import logger
+from ecs_deplojo.task_definitions import TaskDefinition
+
+
+def offload_environments(
+    connection: Connection,
+    task_definitions: typing.Dict[str, TaskDefinition],
+    bucket: str,
+    prefix: str = "",
+) -> None:
+    """Move the environment variables of the containers to `.env` files in S3.
+
+    The containers reference the file via `environmentFiles` instead of
+    listing every variable in `environment`. The files are named after the
+    sha256 of their content so every distinct environment is only uploaded
+    once, also across task definitions and deployments. The existence of
+    the objects is checked on every call, so objects removed from the bucket
+    in the meantime are uploaded again. Values containing a newline can't be
+    stored in an environment file and stay inline.
+
+    The generated file is put before the `environmentFiles` of the template,
+    so (as with the inline environment) the config has precedence over them.
+
+    Note that the execution role of the task definitions needs read access to
+    the objects.
+    """
+    offloaded: typing.Dict[int, typing.Tuple[Environment, typing.Optional[str]]] = {}
+    # The objects which are known to exist during this call
+    uploaded: typing.Set[str] = set()
+
+    for task_definition in task_definitions.values():
+        for container in task_definition.container_definitions:
+            environment = container.get("environment")
+            if not environment:
+                continue
+
+            if id(environment) not in offloaded:
+                offloaded[id(environment)] = _offload(
+                    connection, environment, bucket, prefix, uploaded
+                )
+            inline, arn = offloaded[id(environment)]
+
+            container["environment"] = inline
+            if arn:
+                container["environmentFiles"] = [{"value": arn, "type": "s3"}] + [
+                    item
+                    for item in container.get("environmentFiles", [])
+                    if item.get("value") != arn
+                ]
+
+
+def _offload(
+    connection: Connection,
+    environment: typing.Mapping[str, typing.Any],
+    bucket: str,
+    prefix: str,
+    uploaded: typing.Set[str],
+) -> typing.Tuple[Environment, typing.Optional[str]]:
+    """Upload the environment and return the variables which need to stay
+    inline and the ARN of the object."""
+    lines = []
+    inline = {}
+    for name, value in sorted(environment.items()):
+        value = str(value)
+        if "\n" in value or "\r" in value:
+            inline[name] = value
+        else:
+            lines.append("%s=%s\n" % (name, value))
+
+    if not lines:
+        return Environment(inline), None
+
+    content = "".join(lines).encode("utf-8")
+    key = "%s%s.env" % (prefix, hashlib.sha256(content).hexdigest())
+    if key not in uploaded:
+        if not _object_exists(connection, bucket, key):
+            logger.info("Uploading environment file s3://%s/%s", bucket, key)
+            connection.s3.put_object(
+                Bucket=bucket, Key=key, Body=content, ContentType="text/plain"
+            )
+        uploaded.add(key)
+
+    arn = "arn:%s:s3:::%s/%s" % (connection.s3.meta.partition, bucket, key)
+    return Environment(inline), arn
+
+
+def _object_exists(connection: Connection, bucket: str, key: str) -> bool:
+    try:
+        connection.s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
@@ -1,2 +1,14 @@
 class DeploymentFailed(Exception):
     pass
+
+
+class ValidationError(DeploymentFailed):
+    """The config or the generated task definitions are invalid."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("\n".join(errors))
+
+    def __reduce__(self):
+        # Keep the list of errors when raised in a worker process
+        return self.__class__, (self.errors,)
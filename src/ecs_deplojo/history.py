@@ -0,0 +1,170 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+# The global timeout, used for services without enough history
+DEFAULT_TIMEOUT = 15 * 60
+
+# Timeouts based on the history are the p99 of the last durations times
+# the factor, within the bounds
+TIMEOUT_FACTOR = 2.0
+MIN_TIMEOUT = 60
+MAX_TIMEOUT = 60 * 60
+MIN_SAMPLES = 5
+NUM_SAMPLES = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cluster TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    outcome TEXT
+);
+CREATE TABLE IF NOT EXISTS services (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    cluster TEXT NOT NULL,
+    service TEXT NOT NULL,
+    task_definition TEXT,
+    digest TEXT,
+    duration REAL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS services_cluster_service
+    ON services (cluster, service, outcome);
+"""
+
+
+class History:
+    """Store the timing of deployments in a SQLite database.
+
+    Every run records the outcome and the time it took for every service to
+    become stable, together with the task definition and its digest. The
+    durations of previous runs are used to estimate how long a service takes
+    and when to give up on it, see `Run`.
+
+    The history can be shared between threads.
+    """
+
+    def __init__(self, filename: str):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def start_run(self, cluster: str) -> "Run":
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO runs (cluster, started_at) VALUES (?, ?)",
+                (cluster, time.time()),
+            )
+        return Run(self, typing.cast(int, cursor.lastrowid), cluster)
+
+    def durations(self, cluster: str, service: str) -> typing.List[float]:
+        """Return the durations of the last successful deployments of the
+        service, most recent first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT duration FROM services "
+                "WHERE cluster = ? AND service = ? AND outcome = 'stable' "
+                "ORDER BY rowid DESC LIMIT ?",
+                (cluster, service, NUM_SAMPLES),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def estimate(self, cluster: str, service: str) -> typing.Optional[float]:
+        """Return the median duration of the service, if known."""
+        durations = self.durations(cluster, service)
+        if not durations:
+            return None
+        return percentile(durations, 50)
+
+    def timeout(self, cluster: str, service: str) -> float:
+        """Return after how many seconds to give up on the service."""
+        durations = self.durations(cluster, service)
+        if len(durations) < MIN_SAMPLES:
+            return DEFAULT_TIMEOUT
+        timeout = percentile(durations, 99) * TIMEOUT_FACTOR
+        return min(max(timeout, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def _execute(self, query: str, params: typing.Sequence[typing.Any]) -> None:
+        with self._lock, self._db:
+            self._db.execute(query, params)
+
+
+class Run:
+    """A single deployment in the history."""
+
+    def __init__(self, history: History, run_id: int, cluster: str):
+        self.history = history
+        self.id = run_id
+        self.cluster = cluster
+        self._task_definitions: typing.Dict[str, typing.Tuple[str, str]] = {}
+
+    def set_task_definition(self, service: str, name: str, digest: str) -> None:
+        self._task_definitions[service] = (name, digest)
+
+    def estimate(self, service: str) -> typing.Optional[float]:
+        return self.history.estimate(self.cluster, service)
+
+    def timeout(self, service: str) -> float:
+        return self.history.timeout(self.cluster, service)
+
+    def record_service(self, service: str, duration: float, outcome: str) -> None:
+        name, digest = self._task_definitions.get(service, (None, None))
+        self.history._execute(
+            "INSERT INTO services "
+            "(run_id, cluster, service, task_definition, digest, duration, outcome) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.id, self.cluster, service, name, digest, duration, outcome),
+        )
+
+    def finish(self, outcome: str) -> None:
+        self.history._execute(
+            "UPDATE runs SET finished_at = ?, outcome = ? WHERE id = ?",
+            (time.time(), outcome, self.id),
+        )
+
+
+@contextlib.contextmanager
+def record_run(
+    history: typing.Optional[History], cluster: str
+) -> typing.Iterator[typing.Optional[Run]]:
+    """Record a run in the history, if any, with the outcome of the block."""
+    if history is None:
+        yield None
+        return
+
+    run = history.start_run(cluster)
+    try:
+        yield run
+    except BaseException:
+        run.finish("failed")
+        raise
+    run.finish("success")
+
+
+def percentile(values: typing.Sequence[float], percent: float) -> float:
+    """Return the percentile of the values, using linear interpolation."""
+    values = sorted(values)
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes:
+        return "%dm%02ds" % (minutes, seconds)
+    return "%ds" % seconds
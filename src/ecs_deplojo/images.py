@@ -0,0 +1,129 @@
+import concurrent.futures
+import re
+import typing
+
+from botocore.exceptions import ClientError
+
+from ecs_deplojo.connection import Connection
+from ecs_deplojo.exceptions import DeploymentFailed
+from ecs_deplojo.logger import logger
+from ecs_deplojo.task_definitions import TaskDefinition
+
+# <account>.dkr.ecr.<region>.amazonaws.com[.cn]/<repository>[:<tag>]
+ECR_IMAGE_RE = re.compile(
+    r"^(?P<registry>(?P<account>\d{12})\.dkr\.ecr(?:-fips)?\.(?P<region>[a-z0-9-]+)"
+    r"\.amazonaws\.com(?:\.cn)?)/(?P<repository>[^:@]+)(?::(?P<tag>[^:@]+))?$"
+)
+
+# The maximum number of image ids per describe_images call
+BATCH_SIZE = 100
+
+# Images are grouped by (account, region, repository)
+Repository = typing.Tuple[str, str, str]
+
+
+def pin_image_digests(
+    connection: Connection,
+    task_definitions: typing.Dict[str, TaskDefinition],
+    max_workers: int = 8,
+) -> int:
+    """Replace the tags of ECR images in the containers by their digest.
+
+    This makes sure every task of the deployment runs the same image, also
+    when the tag is moved during the deployment. The tags of all containers
+    are grouped by repository and resolved with as few `describe_images`
+    calls as possible, repositories are queried concurrently. Images outside
+    of ECR or already referencing a digest are left as is.
+
+    Returns the number of rewritten images.
+
+    :raises DeploymentFailed: when an image doesn't exist
+    """
+    containers_by_repository: typing.Dict[
+        Repository, typing.List[typing.Tuple[typing.Dict[str, typing.Any], str, str]]
+    ] = {}
+    for task_definition in task_definitions.values():
+        for container in task_definition.container_definitions or []:
+            match = ECR_IMAGE_RE.match(container.get("image") or "")
+            if not match:
+                continue
+            repository = (match["account"], match["region"], match["repository"])
+            containers_by_repository.setdefault(repository, []).append(
+                (container, match["registry"], match["tag"] or "latest")
+            )
+
+    if not containers_by_repository:
+        return 0
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(containers_by_repository))
+    ) as executor:
+        futures = {
+            repository: executor.submit(
+                resolve_digests,
+                connection,
+                repository,
+                {tag for _, _, tag in containers},
+            )
+            for repository, containers in containers_by_repository.items()
+        }
+        digests = {
+            repository: future.result() for repository, future in futures.items()
+        }
+
+    num = 0
+    for repository, containers in containers_by_repository.items():
+        for container, registry, tag in containers:
+            container["image"] = "%s/%s@%s" % (
+                registry,
+                repository[2],
+                digests[repository][tag],
+            )
+            num += 1
+    logger.info(
+        "Pinned %d images from %d repositories to their digest",
+        num,
+        len(containers_by_repository),
+        extra={"phase": "register"},
+    )
+    return num
+
+
+def resolve_digests(
+    connection: Connection, repository: Repository, tags: typing.Iterable[str]
+) -> typing.Dict[str, str]:
+    """Return the digest of every tag of the repository."""
+    account, region, repository_name = repository
+    if region == connection.ecr.meta.region_name:
+        client = connection.ecr
+    else:
+        client = connection.regional_client("ecr", region)
+
+    tags = sorted(set(tags))
+    result = {}
+    for i in range(0, len(tags), BATCH_SIZE):
+        try:
+            response = client.describe_images(
+                registryId=account,
+                repositoryName=repository_name,
+                imageIds=[{"imageTag": tag} for tag in tags[i : i + BATCH_SIZE]],
+            )
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in (
+                "ImageNotFoundException",
+                "RepositoryNotFoundException",
+            ):
+                raise DeploymentFailed(exc.response["Error"]["Message"]) from exc
+            raise
+
+        for image in response["imageDetails"]:
+            for tag in image.get("imageTags", []):
+                result[tag] = image["imageDigest"]
+
+    missing = [tag for tag in tags if tag not in result]
+    if missing:
+        raise DeploymentFailed(
+            "Images not found in repository %s: %s"
+            % (repository_name, ", ".join(missing))
+        )
+    return result
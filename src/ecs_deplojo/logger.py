@@ -1,4 +1,69 @@
+import atexit
+import copy
+import datetime
+import json
 import logging
+import logging.handlers
+import queue
+
+LOG_FORMATS = ("text", "json")
+
+# Extra attributes of the log records which are included in the JSON output
+EXTRA_FIELDS = (
+    "cluster",
+    "service",
+    "task_definition",
+    "phase",
+    "event_id",
+    "event_time",
+    "duration",
+)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format the log records as JSON objects, one per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(),
+            "level": record.levelname.lower(),
+            "message": record.getMessage(),
+        }
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the default implementation, don't merge the traceback into
+        # the message so the formatter of the listener can handle it
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(log_format: str = "text") -> None:
+    """Set the format of the log output, either `text` or `json`."""
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(TEXT_FORMATTER)
+
+
+TEXT_FORMATTER = logging.Formatter("[%(asctime)s] %(message)s", datefmt="%H:%M:%S")
 
 # Initialize logging
 logger = logging.getLogger("deploy")
@@ -6,5 +71,13 @@ logger.setLevel(logging.DEBUG)
 
 handler = logging.StreamHandler()
 handler.setLevel(logging.DEBUG)
-handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%H:%M:%S"))
-logger.addHandler(handler)
+handler.setFormatter(TEXT_FORMATTER)
+
+# Writing the output happens in a separate thread, so a slow consumer of the
+# output doesn't block the deployment.
+log_queue: queue.Queue = queue.Queue()
+listener = logging.handlers.QueueListener(log_queue, handler)
+listener.start()
+atexit.register(listener.stop)
+
+logger.addHandler(_QueueHandler(log_queue))
@@ -0,0 +1,150 @@
+import copy
+import functools
+import typing
+
+from ecs_deplojo.environment import Environment
+
+# Container keys which are replaced by the override instead of merged
+REPLACE_KEYS = {"command", "entryPoint"}
+
+# Lists of which the items are identified by one or more keys. An item in
+# the overrides replaces the item with the same identity, other items are
+# appended.
+LIST_ITEM_KEYS: typing.Dict[str, typing.Tuple[typing.Tuple[str, typing.Any], ...]] = {
+    "portMappings": (("containerPort", None), ("protocol", "tcp")),
+    "mountPoints": (("containerPath", None),),
+    "volumesFrom": (("sourceContainer", None),),
+    "ulimits": (("name", None),),
+    "extraHosts": (("hostname", None),),
+    "dependsOn": (("containerName", None),),
+    "systemControls": (("namespace", None),),
+    "resourceRequirements": (("type", None),),
+    "environmentFiles": (("value", None),),
+    "secretOptions": (("name", None),),
+}
+
+# Lists nested in mappings (by their path in the container) which are merged.
+# An empty identity means the items which are not in the list yet are
+# appended. All other nested lists, like `healthCheck.command`, are replaced.
+NESTED_LIST_ITEM_KEYS: typing.Dict[
+    str, typing.Tuple[typing.Tuple[str, typing.Any], ...]
+] = {
+    "linuxParameters.capabilities.add": (),
+    "linuxParameters.capabilities.drop": (),
+    "linuxParameters.devices": (("containerPath", None),),
+    "linuxParameters.tmpfs": (("containerPath", None),),
+    "logConfiguration.secretOptions": (("name", None),),
+}
+
+Merge = typing.Callable[[typing.Any, typing.Any], typing.Any]
+MergePlan = typing.Dict[str, typing.List[typing.Tuple[str, Merge, typing.Any]]]
+
+
+def compile_overrides(
+    overrides: typing.Dict[str, typing.Dict[str, typing.Any]],
+) -> MergePlan:
+    """Compile the container overrides of a task definition to a merge plan.
+
+    The plan contains the merge strategy for every overridden key per
+    container name:
+
+    - environment variables and secrets are added as a layer on top of the
+      existing ones
+    - the keys in `REPLACE_KEYS` and all scalar values are replaced
+    - lists are merged by the identity of their items (see `LIST_ITEM_KEYS`),
+      other lists are extended with the items which are not in it yet
+    - mappings are merged recursively, lists nested in them are replaced
+      unless listed in `NESTED_LIST_ITEM_KEYS`
+
+    """
+    plan: MergePlan = {}
+    for container_name, container_overrides in overrides.items():
+        plan[container_name] = [
+            (key, _strategy(key, value), value)
+            for key, value in container_overrides.items()
+        ]
+    return plan
+
+
+def apply_plan(
+    containers: typing.List[typing.Dict[str, typing.Any]], plan: MergePlan
+) -> None:
+    """Apply a merge plan to the container definitions, in place."""
+    for container in containers:
+        for key, merge, value in plan.get(container["name"], ()):
+            container[key] = merge(container.get(key), value)
+
+
+def _strategy(key: str, value: typing.Any) -> Merge:
+    if key in ("environment", "secrets"):
+        return _merge_layer
+    if key in REPLACE_KEYS or not isinstance(value, (list, dict)):
+        return _replace
+    if isinstance(value, list):
+        identity = LIST_ITEM_KEYS.get(key)
+        if identity:
+            return functools.partial(_merge_by_identity, identity=identity)
+        return _append_unique
+    return functools.partial(_deep_merge, path=key)
+
+
+def _replace(current, value):
+    return copy.deepcopy(value)
+
+
+def _merge_layer(current, value):
+    if isinstance(current, Environment):
+        return current.with_layer(value)
+    return _deep_merge(current, value)
+
+
+def _append_unique(current, value):
+    if not isinstance(current, list):
+        return copy.deepcopy(value)
+    result = list(current)
+    for item in value:
+        if item not in result:
+            result.append(copy.deepcopy(item))
+    return result
+
+
+def _merge_by_identity(current, value, identity):
+    if not isinstance(current, list):
+        return copy.deepcopy(value)
+
+    def key(item):
+        if not isinstance(item, dict):
+            return item
+        return tuple(item.get(name, default) for name, default in identity)
+
+    result = list(current)
+    positions = {key(item): i for i, item in enumerate(result)}
+    for item in value:
+        position = positions.get(key(item))
+        if position is None:
+            positions[key(item)] = len(result)
+            result.append(copy.deepcopy(item))
+        else:
+            result[position] = copy.deepcopy(item)
+    return result
+
+
+def _deep_merge(current, value, path=""):
+    """Merge the mapping recursively, without modifying `current`."""
+    if not isinstance(current, typing.Mapping) or not isinstance(value, dict):
+        return copy.deepcopy(value)
+
+    result = dict(current)
+    for key, item in value.items():
+        item_path = "%s.%s" % (path, key) if path else key
+        if isinstance(item, dict):
+            result[key] = _deep_merge(result.get(key), item, item_path)
+        elif isinstance(item, list) and item_path in NESTED_LIST_ITEM_KEYS:
+            identity = NESTED_LIST_ITEM_KEYS[item_path]
+            if identity:
+                result[key] = _merge_by_identity(result.get(key), item, identity)
+            else:
+                result[key] = _append_unique(result.get(key), item)
+        else:
+            result[key] = copy.deepcopy(item)
+    return result
@@ -0,0 +1,125 @@
+import collections
+import contextlib
+import cProfile
+import os
+import sys
+import threading
+import time
+import typing
+
+from ecs_deplojo.logger import logger
+
+DEFAULT_INTERVAL = 0.005
+
+
+class Sampler(threading.Thread):
+    """Sample the stacks of all threads at a fixed interval.
+
+    Every sample is labeled `cpu` when the thread used the CPU since the
+    previous sample and `wait` otherwise (e.g. sleeping or waiting for a
+    response of AWS). Without per-thread CPU clocks all samples are labeled
+    `wall`.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        super().__init__(name="ecs-deplojo-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: typing.Counter[str] = collections.Counter()
+        self._stopped = threading.Event()
+        self._cpu_times: typing.Dict[int, float] = {}
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            self.sample(now - last)
+            last = now
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def sample(self, elapsed: float) -> None:
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            state = self._state(thread_id, elapsed)
+            self.stacks[";".join([state] + _stack(frame))] += 1
+
+    def _state(self, thread_id: int, elapsed: float) -> str:
+        try:
+            cpu_time = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except (AttributeError, OSError):
+            return "wall"
+        previous = self._cpu_times.get(thread_id)
+        self._cpu_times[thread_id] = cpu_time
+        if previous is None:
+            return "wall"
+        return "cpu" if cpu_time - previous >= elapsed / 2 else "wait"
+
+    def write_collapsed(self, filename: str) -> None:
+        """Write the stacks in the collapsed format used by flamegraph.pl and
+        speedscope."""
+        with open(filename, "w") as fh:
+            for stack, count in sorted(self.stacks.items()):
+                fh.write("%s %d\n" % (stack, count))
+
+
+def _stack(frame) -> typing.List[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        name = "%s (%s)" % (code.co_name, _short_filename(code.co_filename))
+        stack.append(name.replace(";", ":"))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _short_filename(filename: str) -> str:
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            return filename[len(path) + 1 :]
+    return filename
+
+
+@contextlib.contextmanager
+def profile(prefix: str, interval: float = DEFAULT_INTERVAL):
+    """Profile the code in the block.
+
+    Writes the cProfile statistics of the current thread to
+    `<prefix>.pstats` and the sampled stacks of all threads to
+    `<prefix>.collapsed`, and logs how much of the wall time the current
+    thread spent using the CPU and how much waiting.
+    """
+    profiler = cProfile.Profile()
+    sampler = Sampler(interval)
+    start_wall = time.perf_counter()
+    start_thread = time.thread_time()
+    start_process = time.process_time()
+
+    sampler.start()
+    profiler.enable()
+    try:
+        yield sampler
+    finally:
+        profiler.disable()
+        sampler.stop()
+        wall_time = time.perf_counter() - start_wall
+        thread_time = time.thread_time() - start_thread
+        process_time = time.process_time() - start_process
+
+        profiler.dump_stats("%s.pstats" % prefix)
+        sampler.write_collapsed("%s.collapsed" % prefix)
+        logger.info(
+            "Profile: %.2fs wall time, %.2fs cpu and %.2fs waiting "
+            "(%.2fs cpu in all threads), written to %s.pstats and %s.collapsed",
+            wall_time,
+            thread_time,
+            max(wall_time - thread_time, 0),
+            process_time,
+            prefix,
+            prefix,
+            extra={"phase": "profile", "duration": round(wall_time, 3)},
+        )
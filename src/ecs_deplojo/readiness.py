@@ -0,0 +1,181 @@
+import typing
+
+from ecs_deplojo.connection import Connection
+
+READINESS_MODES = ("deployments", "target_health")
+
+Target = typing.Tuple[str, int]
+
+
+class TargetHealth:
+    """Decide if services are ready from the health of their new tasks in
+    the target groups of the load balancers.
+
+    A service is ready when its primary deployment runs the desired number
+    of tasks and the targets of all those tasks are healthy in every target
+    group of the service. Services without load balancers are ready when
+    the old deployments are gone.
+    """
+
+    def __init__(self, connection: Connection, cluster_name: str):
+        self.connection = connection
+        self.cluster_name = cluster_name
+        self._instance_ids: typing.Dict[str, str] = {}
+
+    def ready_services(
+        self, services: typing.List[typing.Dict[str, typing.Any]]
+    ) -> typing.Set[str]:
+        """Return the names of the services which are ready."""
+        ready = set()
+        candidates = []
+        for service in services:
+            primary = _primary_deployment(service)
+            if not service.get("loadBalancers"):
+                if len(service["deployments"]) == 1:
+                    ready.add(service["serviceName"])
+            elif primary and primary["desiredCount"] == 0:
+                ready.add(service["serviceName"])
+            elif primary and primary["runningCount"] >= primary["desiredCount"]:
+                candidates.append((service, primary))
+
+        if not candidates:
+            return ready
+
+        tasks = self._running_tasks([service for service, _ in candidates])
+        self._resolve_instance_ids(tasks)
+
+        expected: typing.Dict[str, typing.Dict[str, typing.Set[Target]]] = {}
+        for service, primary in candidates:
+            new_tasks = [
+                task
+                for task in tasks.get(service["serviceName"], [])
+                if task["taskDefinitionArn"] == primary["taskDefinition"]
+            ]
+            if len(new_tasks) < primary["desiredCount"]:
+                continue
+            expected[service["serviceName"]] = {
+                lb["targetGroupArn"]: self._targets(new_tasks, lb)
+                for lb in service["loadBalancers"]
+                if lb.get("targetGroupArn")
+            }
+
+        # One call per target group, shared by all services using it
+        target_groups = {arn for groups in expected.values() for arn in groups}
+        health = {arn: self._target_health(arn) for arn in sorted(target_groups)}
+
+        for service_name, groups in expected.items():
+            if all(
+                targets
+                and all(health[arn].get(target) == "healthy" for target in targets)
+                for arn, targets in groups.items()
+            ):
+                ready.add(service_name)
+        return ready
+
+    def _running_tasks(
+        self, services: typing.List[typing.Dict[str, typing.Any]]
+    ) -> typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]]:
+        """Return the running tasks per service name."""
+        task_arns = []
+        paginator = self.connection.ecs.get_paginator("list_tasks")
+        for service in services:
+            for page in paginator.paginate(
+                cluster=self.cluster_name,
+                serviceName=service["serviceName"],
+                desiredStatus="RUNNING",
+            ):
+                task_arns.extend(page["taskArns"])
+
+        result: typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]] = {}
+        for i in range(0, len(task_arns), 100):
+            response = self.connection.ecs.describe_tasks(
+                cluster=self.cluster_name, tasks=task_arns[i : i + 100]
+            )
+            for task in response["tasks"]:
+                group = task.get("group", "")
+                if task.get("lastStatus") == "RUNNING" and group.startswith("service:"):
+                    result.setdefault(group[len("service:") :], []).append(task)
+        return result
+
+    def _resolve_instance_ids(
+        self, tasks: typing.Dict[str, typing.List[typing.Dict[str, typing.Any]]]
+    ) -> None:
+        """Look up the EC2 instance ids of the container instances running the
+        tasks, these are the targets of target groups with the instance type.
+        """
+        unknown = sorted(
+            {
+                task["containerInstanceArn"]
+                for service_tasks in tasks.values()
+                for task in service_tasks
+                if task.get("containerInstanceArn")
+                and task["containerInstanceArn"] not in self._instance_ids
+            }
+        )
+        for i in range(0, len(unknown), 100):
+            response = self.connection.ecs.describe_container_instances(
+                cluster=self.cluster_name, containerInstances=unknown[i : i + 100]
+            )
+            for instance in response["containerInstances"]:
+                self._instance_ids[instance["containerInstanceArn"]] = instance[
+                    "ec2InstanceId"
+                ]
+
+    def _targets(
+        self,
+        tasks: typing.List[typing.Dict[str, typing.Any]],
+        load_balancer: typing.Dict[str, typing.Any],
+    ) -> typing.Set[Target]:
+        targets = set()
+        for task in tasks:
+            instance_id = self._instance_ids.get(task.get("containerInstanceArn", ""))
+            targets.update(task_targets(task, load_balancer, instance_id))
+        return targets
+
+    def _target_health(self, target_group_arn: str) -> typing.Dict[Target, str]:
+        response = self.connection.elbv2.describe_target_health(
+            TargetGroupArn=target_group_arn
+        )
+        return {
+            (item["Target"]["Id"], item["Target"].get("Port")): item["TargetHealth"][
+                "State"
+            ]
+            for item in response["TargetHealthDescriptions"]
+        }
+
+
+def task_targets(
+    task: typing.Dict[str, typing.Any],
+    load_balancer: typing.Dict[str, typing.Any],
+    instance_id: typing.Optional[str] = None,
+) -> typing.Set[Target]:
+    """Return the targets of the task for the load balancer of a service.
+
+    Tasks using the awsvpc network mode are registered by ip address and
+    container port, other tasks by EC2 instance id and host port.
+    """
+    targets = set()
+    for container in task.get("containers", []):
+        if container.get("name") != load_balancer.get("containerName"):
+            continue
+
+        for interface in container.get("networkInterfaces", []):
+            if interface.get("privateIpv4Address"):
+                targets.add(
+                    (interface["privateIpv4Address"], load_balancer["containerPort"])
+                )
+
+        if instance_id:
+            for binding in container.get("networkBindings", []):
+                if binding.get("containerPort") == load_balancer["containerPort"]:
+                    targets.add((instance_id, binding["hostPort"]))
+    return targets
+
+
+def _primary_deployment(
+    service: typing.Dict[str, typing.Any],
+) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    for deployment in service["deployments"]:
+        if deployment.get("status") == "PRIMARY":
+            return deployment
+    return None
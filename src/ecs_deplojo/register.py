@@ -1,3 +1,4 @@
+import concurrent.futures
 import typing
 
 from ecs_deplojo.connection import Connection
@@ -21,7 +22,11 @@ def register_task_definitions(
             result["taskDefinition"]["revision"],
         )
         task_definition.arn = result["taskDefinition"]["taskDefinitionArn"]
-        logger.info("Registered new task definition %s", task_definition)
+        logger.info(
+            "Registered new task definition %s",
+            task_definition,
+            extra={"phase": "register", "task_definition": task_definition.name},
+        )
 
 
 def update_scheduled_tasks(
@@ -42,6 +47,108 @@ def update_scheduled_tasks(
         connection.events.put_targets(Rule=rule_name, Targets=targets["Targets"])
 
 
+def update_discovered_rules(
+    connection: Connection,
+    cluster_name: str,
+    task_definitions: typing.Dict[str, TaskDefinition],
+    exclude: typing.Iterable[str] = (),
+) -> int:
+    """Update the ECS targets of all EventBridge rules which run a task of one
+    of the task definition families on the cluster.
+
+    The rules are found via an index of the family names used by the rules,
+    see `discover_rules()`. Rules in `exclude` (the configured scheduled
+    tasks) are skipped. Returns the number of updated targets.
+    """
+    index = discover_rules(connection, cluster_name)
+    exclude = set(exclude)
+    num = 0
+
+    for task_definition in task_definitions.values():
+        family = task_definition.family
+        for rule_name in sorted(index.get(family, set()) - exclude):
+            try:
+                response = connection.events.list_targets_by_rule(Rule=rule_name)
+            except connection.events.exceptions.ResourceNotFoundException:
+                continue
+
+            targets = [
+                target
+                for target in response["Targets"]
+                if _target_family(target) == family
+                and target["EcsParameters"]["TaskDefinitionArn"] != task_definition.arn
+            ]
+            if not targets:
+                continue
+
+            for target in targets:
+                target["EcsParameters"]["TaskDefinitionArn"] = task_definition.arn
+            logger.info(
+                "Updating %d targets of rule %s to %s",
+                len(targets),
+                rule_name,
+                task_definition.name,
+                extra={"phase": "register", "task_definition": task_definition.name},
+            )
+            connection.events.put_targets(Rule=rule_name, Targets=targets)
+            num += len(targets)
+    return num
+
+
+def discover_rules(
+    connection: Connection, cluster_name: str, max_workers: int = 8
+) -> typing.Dict[str, typing.Set[str]]:
+    """Return the names of the EventBridge rules per task definition family
+    of their ECS targets on the cluster.
+
+    Only the rules targeting the cluster are requested, with
+    `list_rule_names_by_target`, after which their targets are requested
+    concurrently. Other rules in the account are never scanned.
+    """
+    response = connection.ecs.describe_clusters(clusters=[cluster_name])
+    if not response["clusters"]:
+        return {}
+    cluster_arn = response["clusters"][0]["clusterArn"]
+
+    rule_names = []
+    paginator = connection.events.get_paginator("list_rule_names_by_target")
+    for page in paginator.paginate(TargetArn=cluster_arn):
+        rule_names.extend(page["RuleNames"])
+
+    def families(rule_name: str) -> typing.Set[str]:
+        result = set()
+        paginator = connection.events.get_paginator("list_targets_by_rule")
+        try:
+            for page in paginator.paginate(Rule=rule_name):
+                for target in page["Targets"]:
+                    family = _target_family(target)
+                    if family and target.get("Arn") == cluster_arn:
+                        result.add(family)
+        except connection.events.exceptions.ResourceNotFoundException:
+            pass
+        return result
+
+    index: typing.Dict[str, typing.Set[str]] = {}
+    if rule_names:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(max_workers, len(rule_names))
+        ) as executor:
+            for rule_name, rule_families in zip(
+                rule_names, executor.map(families, rule_names)
+            ):
+                for family in rule_families:
+                    index.setdefault(family, set()).add(rule_name)
+    return index
+
+
+def _target_family(target: typing.Dict[str, typing.Any]) -> typing.Optional[str]:
+    """Return the family of the task definition ARN of an ECS target."""
+    arn = (target.get("EcsParameters") or {}).get("TaskDefinitionArn")
+    if not arn or ":task-definition/" not in arn:
+        return None
+    return arn.split(":task-definition/", 1)[1].split(":", 1)[0]
+
+
 def deregister_task_definitions(
     connection: Connection, task_definitions: typing.Dict[str, TaskDefinition]
 ) -> None:
@@ -59,9 +166,13 @@ def deregister_task_definitions(
                 if tags.get("createdBy") == "ecs-deplojo":
                     yield arn
 
-    logger.info("Deregistering old task definitions")
+    logger.info("Deregistering old task definitions", extra={"phase": "deregister"})
     for service_name, task_definition in task_definitions.items():
-        logger.info(" - %s", task_definition.family)
+        logger.info(
+            " - %s",
+            task_definition.family,
+            extra={"phase": "deregister", "task_definition": task_definition.family},
+        )
 
         num = 0
 
@@ -0,0 +1,116 @@
+import concurrent.futures
+import typing
+
+from botocore.exceptions import ClientError
+
+from ecs_deplojo.connection import Connection
+from ecs_deplojo.exceptions import ValidationError
+from ecs_deplojo.logger import logger
+from ecs_deplojo.task_definitions import TaskDefinition
+
+# The maximum number of names per ssm.get_parameters call
+SSM_BATCH_SIZE = 10
+
+
+def check_secrets(
+    connection: Connection,
+    task_definitions: typing.Dict[str, TaskDefinition],
+    max_workers: int = 8,
+) -> None:
+    """Check that all secrets referenced by the containers exist.
+
+    The references (`valueFrom`) are collected from all task definitions
+    and checked once each: SSM parameters with `get_parameters` in batches
+    of 10, Secrets Manager secrets with `describe_secret`. The calls are
+    done concurrently. Secret values are never read.
+
+    :raises ValidationError: listing the secrets which don't exist
+    """
+    references: typing.Dict[str, typing.Set[str]] = {}
+    for name, task_definition in task_definitions.items():
+        for container in task_definition.container_definitions or []:
+            for item in _secret_items(container.get("secrets")):
+                references.setdefault(item, set()).add(name)
+
+    if not references:
+        return
+
+    parameters_by_region: typing.Dict[str, typing.List[str]] = {}
+    secrets: typing.Dict[str, str] = {}
+    for reference in sorted(references):
+        if reference.startswith("arn:") and ":secretsmanager:" in reference:
+            # Strip the json-key, version-stage and version-id of the ARN
+            secrets[reference] = ":".join(reference.split(":")[:7])
+        else:
+            region = _arn_region(reference) or connection.ecs.meta.region_name
+            parameters_by_region.setdefault(region, []).append(reference)
+
+    jobs = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for region, names in parameters_by_region.items():
+            for i in range(0, len(names), SSM_BATCH_SIZE):
+                jobs.append(
+                    executor.submit(
+                        _missing_parameters,
+                        _client(connection, "ssm", region),
+                        names[i : i + SSM_BATCH_SIZE],
+                    )
+                )
+        for reference, secret_id in secrets.items():
+            region = _arn_region(secret_id) or connection.ecs.meta.region_name
+            jobs.append(
+                executor.submit(
+                    _missing_secret,
+                    _client(connection, "secretsmanager", region),
+                    reference,
+                    secret_id,
+                )
+            )
+        missing = sorted(name for job in jobs for name in job.result())
+
+    if missing:
+        raise ValidationError(
+            [
+                "Secret %s (used by %s) does not exist"
+                % (name, ", ".join(sorted(references[name])))
+                for name in missing
+            ]
+        )
+    logger.info("Checked %d secrets", len(references), extra={"phase": "check_secrets"})
+
+
+def _secret_items(secrets) -> typing.Iterator[str]:
+    if not secrets:
+        return
+    if isinstance(secrets, typing.Mapping):
+        yield from (str(value) for value in secrets.values())
+    else:
+        yield from (item["valueFrom"] for item in secrets)
+
+
+def _missing_parameters(client, names: typing.List[str]) -> typing.List[str]:
+    response = client.get_parameters(Names=names)
+    return response["InvalidParameters"]
+
+
+def _missing_secret(client, reference: str, secret_id: str) -> typing.List[str]:
+    try:
+        client.describe_secret(SecretId=secret_id)
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] == "ResourceNotFoundException":
+            return [reference]
+        raise
+    return []
+
+
+def _arn_region(reference: str) -> typing.Optional[str]:
+    parts = reference.split(":")
+    if reference.startswith("arn:") and len(parts) > 3 and parts[3]:
+        return parts[3]
+    return None
+
+
+def _client(connection: Connection, service_name: str, region_name: str):
+    if region_name == connection.ecs.meta.region_name:
+        return getattr(connection, service_name)
+    return connection.regional_client(service_name, region_name)
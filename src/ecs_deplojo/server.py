@@ -0,0 +1,331 @@
+import hmac
+import http.server
+import json
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+import typing
+
+import click
+
+from ecs_deplojo import cli
+from ecs_deplojo.config import load_config
+from ecs_deplojo.connection import get_connection
+from ecs_deplojo.exceptions import ValidationError
+from ecs_deplojo.history import History
+from ecs_deplojo.logger import LOG_FORMATS, configure_logging, logger
+from ecs_deplojo.task_definitions import TemplateCache, payload_digest
+
+DEFAULT_PORT = 8057
+
+# Marks the end of the events of a deployment
+_DONE = object()
+
+
+class DeployState:
+    """State shared by all deployments of the server.
+
+    The connections are shared via `get_connection()`, the parsed configs
+    via `load_config()` and the parsed templates and their digests via the
+    template cache. The number of concurrent deployments is limited per
+    cluster.
+
+    Requests need the `token` when one is set, and can only pass their own
+    role when `allow_role_arn` is enabled.
+    """
+
+    def __init__(
+        self,
+        role_arn: typing.Optional[str] = None,
+        max_concurrent_deploys: int = 1,
+        cache_dir: typing.Optional[str] = None,
+        history_path: typing.Optional[str] = None,
+        token: typing.Optional[str] = None,
+        allow_role_arn: bool = False,
+    ):
+        self.role_arn = role_arn
+        self.token = token
+        self.allow_role_arn = allow_role_arn
+        self.max_concurrent_deploys = max_concurrent_deploys
+        self.cache_dir = cache_dir
+        self.history = History(history_path) if history_path else None
+        self.template_cache = TemplateCache()
+        self._semaphores: typing.Dict[str, threading.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def cluster_semaphore(self, cluster_name: str) -> threading.Semaphore:
+        with self._lock:
+            if cluster_name not in self._semaphores:
+                self._semaphores[cluster_name] = threading.BoundedSemaphore(
+                    self.max_concurrent_deploys
+                )
+            return self._semaphores[cluster_name]
+
+    def request_role_arn(
+        self, request: typing.Dict[str, typing.Any]
+    ) -> typing.Optional[str]:
+        if self.allow_role_arn and request.get("role_arn"):
+            return request["role_arn"]
+        return self.role_arn
+
+    def is_authorized(self, authorization: typing.Optional[str]) -> bool:
+        """Check the `Authorization: Bearer <token>` header of a request."""
+        if not self.token:
+            return True
+        expected = "Bearer %s" % self.token
+        return hmac.compare_digest(
+            (authorization or "").encode("utf-8"), expected.encode("utf-8")
+        )
+
+    def deploy(self, request: typing.Dict[str, typing.Any]) -> typing.Dict[str, str]:
+        """Deploy the config of the request, see `cli.deploy()`.
+
+        Returns the digest of every generated task definition.
+        """
+        filename = request["config"]
+        cluster_name = load_config(filename).get("cluster_name")
+        semaphore = self.cluster_semaphore(str(cluster_name))
+        if not semaphore.acquire(blocking=False):
+            logger.info("Waiting for other deployments on cluster %s", cluster_name)
+            semaphore.acquire()
+
+        try:
+            task_definitions = cli.deploy(
+                filename,
+                {str(k): str(v) for k, v in (request.get("vars") or {}).items()},
+                create_missing_services=bool(request.get("create_missing_services")),
+                dry_run=bool(request.get("dry_run")),
+                cache_dir=self.cache_dir,
+                connection=get_connection(self.request_role_arn(request)),
+                template_cache=self.template_cache,
+                history=self.history,
+            )
+        finally:
+            semaphore.release()
+
+        return {
+            name: payload_digest(task_definition.as_dict())
+            for name, task_definition in task_definitions.items()
+        }
+
+
+class _EventHandler(logging.Handler):
+    """Collect the log records emitted by a single thread."""
+
+    def __init__(self, events: queue.Queue):
+        super().__init__(logging.DEBUG)
+        self.thread_id: typing.Optional[int] = None
+        self.events = events
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self.thread_id:
+            return
+        self.events.put(
+            {
+                "event": "log",
+                "time": record.created,
+                "level": record.levelname.lower(),
+                "message": record.getMessage(),
+            }
+        )
+
+
+class DeployRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handle the API requests:
+
+    - ``GET /health`` returns ``{"status": "ok"}``
+    - ``POST /deploy`` with a JSON object containing ``config`` (the path of
+      the config file) and optionally ``vars``, ``dry_run``,
+      ``create_missing_services`` and ``role_arn``. The response is a stream of
+      JSON objects, one per line, with the log messages of the deployment
+      followed by a ``finished`` or ``failed`` event.
+
+    Deploy requests need the ``Content-Type: application/json`` and the token
+    of the server, if any. Requests with an ``Origin`` header are rejected,
+    so web pages can't start deployments via the browser.
+    """
+
+    server: "DeployServerMixin"
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._send_json(404, {"error": "not found"})
+        return self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        if self.path != "/deploy":
+            return self._send_json(404, {"error": "not found"})
+        if "Origin" in self.headers:
+            return self._send_json(403, {"error": "cross-origin requests not allowed"})
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type.lower() != "application/json":
+            return self._send_json(415, {"error": "expected application/json"})
+        if not self.server.state.is_authorized(self.headers.get("Authorization")):
+            return self._send_json(401, {"error": "invalid token"})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON"})
+        if not isinstance(request, dict) or not isinstance(request.get("config"), str):
+            return self._send_json(400, {"error": "config is required"})
+        if request.get("role_arn") and not self.server.state.allow_role_arn:
+            return self._send_json(403, {"error": "role_arn is not allowed"})
+
+        events: queue.Queue = queue.Queue()
+        handler = _EventHandler(events)
+        thread = threading.Thread(
+            target=self._deploy, args=(request, handler), daemon=True
+        )
+        logger.addHandler(handler)
+        try:
+            thread.start()
+            self._stream(events)
+        finally:
+            thread.join()
+            logger.removeHandler(handler)
+
+    def _deploy(self, request, handler: _EventHandler) -> None:
+        handler.thread_id = threading.get_ident()
+        events = handler.events
+        start_time = time.monotonic()
+        result: typing.Dict[str, typing.Any]
+        try:
+            digests = self.server.state.deploy(request)
+        except ValidationError as exc:
+            result = {"event": "failed", "error": str(exc), "errors": exc.errors}
+        except Exception as exc:
+            logger.exception("Deployment of %s failed", request["config"])
+            result = {"event": "failed", "error": str(exc)}
+        else:
+            result = {"event": "finished", "task_definitions": digests}
+
+        result.update(time=time.time(), duration=time.monotonic() - start_time)
+        events.put(result)
+        events.put(_DONE)
+
+    def _stream(self, events: queue.Queue) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        connected = True
+        while True:
+            event = events.get()
+            if event is _DONE:
+                break
+            if not connected:
+                continue
+            # The deployment continues when the client disconnects
+            try:
+                self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+                self.wfile.flush()
+            except OSError:
+                connected = False
+
+    def _send_json(self, status: int, data: typing.Any) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # Clients of a unix socket don't have an address
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "local"
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class DeployServerMixin:
+    state: DeployState
+
+
+class DeployServer(DeployServerMixin, http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: typing.Tuple[str, int], state: DeployState):
+        self.state = state
+        super().__init__(address, DeployRequestHandler)
+
+
+class UnixDeployServer(DeployServerMixin, socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, state: DeployState):
+        self.state = state
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, DeployRequestHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        # Only the user running the server can connect
+        os.chmod(self.server_address, 0o600)
+        # Attributes expected by BaseHTTPRequestHandler
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", type=str)
+@click.option("--port", default=DEFAULT_PORT, type=int)
+@click.option("--socket", "socket_path", required=False, type=click.Path())
+@click.option("--role-arn", required=False, type=str)
+@click.option("--max-concurrent-deploys", default=1, type=click.IntRange(min=1))
+@click.option("--cache-dir", required=False, type=click.Path(file_okay=False))
+@click.option("--log-format", default="text", type=click.Choice(LOG_FORMATS))
+@click.option("--history", "history_path", required=False, type=click.Path())
+@click.option("--token", envvar="ECS_DEPLOJO_SERVER_TOKEN", required=False, type=str)
+@click.option("--allow-role-arn", is_flag=True, default=False)
+def main(
+    host,
+    port,
+    socket_path=None,
+    role_arn=None,
+    max_concurrent_deploys=1,
+    cache_dir=None,
+    log_format="text",
+    history_path=None,
+    token=None,
+    allow_role_arn=False,
+):
+    """Run a deploy server keeping clients and caches warm between deploys."""
+    if not socket_path and not token:
+        raise click.UsageError(
+            "A --token (or ECS_DEPLOJO_SERVER_TOKEN) is required when listening "
+            "on a TCP port, use --socket to rely on the file permissions instead"
+        )
+    configure_logging(log_format)
+    state = DeployState(
+        role_arn,
+        max_concurrent_deploys,
+        cache_dir,
+        history_path,
+        token=token,
+        allow_role_arn=allow_role_arn,
+    )
+    server: socketserver.BaseServer
+    if socket_path:
+        server = UnixDeployServer(socket_path, state)
+        logger.info("Listening on %s", socket_path)
+    else:
+        server = DeployServer((host, port), state)
+        logger.info("Listening on http://%s:%d", host, server.server_address[1])
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
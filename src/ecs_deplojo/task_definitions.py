@@ -1,10 +1,50 @@
+import concurrent.futures
 import copy
+import hashlib
 import json
 import operator
 import os.path
 import typing
 from string import Template
 
+from ecs_deplojo import merge, utils
+from ecs_deplojo.cache import GenerationCache, make_key
+from ecs_deplojo.environment import Environment, as_list, substitute
+from ecs_deplojo.exceptions import ValidationError
+
+WORKER_TYPES = ("thread", "process")
+
+# With "image" only the image of the containers is interpolated, with
+# "document" all strings in the task definition are.
+INTERPOLATION_MODES = ("image", "document")
+
+# The container mappings which are converted to lists of name/value pairs
+SERIALIZED_KEYS = {"environment": "value", "secrets": "valueFrom"}
+EMPTY = Environment()
+
+# Keys which are not part of the task definition as stored by ECS. These are
+# either set by ecs-deplojo itself, are only returned by
+# `ECS.Client.describe_task_definition` or are stored separately (tags).
+NON_CANONICAL_KEYS = {
+    "arn",
+    "name",
+    "tags",
+    "taskDefinitionArn",
+    "revision",
+    "status",
+    "requiresAttributes",
+    "compatibilities",
+    "registeredAt",
+    "registeredBy",
+    "deregisteredAt",
+    "deleteRequestedAt",
+}
+
+# Values ECS fills in when they are omitted from the register payload.
+TASK_DEFAULTS = {"networkMode": "bridge"}
+CONTAINER_DEFAULTS = {"cpu": 0, "essential": True}
+PORT_MAPPING_DEFAULTS = {"protocol": "tcp"}
+
 
 class TaskDefinition:
     """A TaskDefinition exists out of a set of containers."""
@@ -21,54 +61,135 @@ class TaskDefinition:
         """Output the TaskDefinition in a boto3 compatible format.
 
         See the boto3 documentation on `ECS.Client.register_task_definition`.
+
+        The `environment` and `secrets` lists are built once per distinct
+        mapping and shared between the containers (and between calls when the
+        mapping is an `Environment`), so these should not be modified.
         """
-        result = copy.deepcopy(self._data)
-        for container in result["containerDefinitions"]:
-            container["environment"] = sorted(
-                [
-                    {"name": k, "value": str(v)}
-                    for k, v in container.get("environment", {}).items()
-                ],
-                key=operator.itemgetter("name"),
-            )
-            container["secrets"] = sorted(
-                [
-                    {"name": k, "valueFrom": str(v)}
-                    for k, v in container.get("secrets", {}).items()
-                ],
-                key=operator.itemgetter("name"),
-            )
+        lists: typing.Dict[typing.Tuple[int, str], typing.List] = {}
+
+        def serialize(mapping, value_key):
+            key = (id(mapping), value_key)
+            if key not in lists:
+                lists[key] = as_list(mapping, value_key)
+            return lists[key]
+
+        result = {}
+        for key, value in self._data.items():
+            if key != "containerDefinitions":
+                result[key] = copy.deepcopy(value)
+                continue
+
+            result[key] = containers = []
+            for container in value:
+                item = {
+                    k: v if k in SERIALIZED_KEYS else copy.deepcopy(v)
+                    for k, v in container.items()
+                }
+                for k, value_key in SERIALIZED_KEYS.items():
+                    item[k] = serialize(item.get(k, EMPTY), value_key)
+                containers.append(item)
         return result
 
+    def canonical(self) -> typing.Dict[str, typing.Any]:
+        """Return the normalized register payload, see `canonicalize()`."""
+        return canonicalize(self.as_dict())
+
+    def digest(self) -> str:
+        """Return a digest of the task definition as it would be stored by ECS.
+
+        Two task definitions with the same digest result in the same task
+        definition in ECS, regardless of the name, revision or tags.
+        """
+        return payload_digest(self.as_dict())
+
     def apply_variables(self, variables: typing.Dict[str, str]):
         """Interpolate all the variables used in the task definition"""
         for container in self.container_definitions:
             container["image"] = Template(container["image"]).substitute(variables)
 
-    def apply_overrides(self, overrides):
-        """Apply overrides for all containers within this task definition."""
+    def interpolate(
+        self,
+        variables: typing.Dict[str, str],
+        placeholders: typing.Optional[typing.List["Placeholder"]] = None,
+    ):
+        """Interpolate the variables in all strings of the task definition.
+
+        The `placeholders` are the strings which contain a `$`, see
+        `find_placeholders()`. All other strings are left untouched, as are
+        the environment variables and secrets, see `interpolate_environment()`.
+
+        :raises ValidationError: for unknown variables and invalid
+            placeholders, naming the task definition and the key
+        """
+        if placeholders is None:
+            placeholders = find_placeholders(self._data)
+
+        for path, template in placeholders:
+            try:
+                parent = self._data
+                for key in path[:-1]:
+                    parent = parent[key]
+                value = parent[path[-1]]
+            except (KeyError, IndexError, TypeError):
+                continue
+
+            # Skip values which were changed after the template was loaded
+            if value == template.template:
+                parent[path[-1]] = substitute(
+                    template,
+                    variables,
+                    "Task definition %s, %s"
+                    % (self.family, ".".join(str(key) for key in path)),
+                )
+
+    def interpolate_environment(self, variables: typing.Dict[str, str]):
+        """Interpolate the variables in the environment variables and secrets
+        of the containers.
+
+        :raises ValidationError: for unknown variables and invalid
+            placeholders, naming the task definition and the variable
+        """
         for container in self.container_definitions:
-            container_overrides = overrides.get(container["name"], {})
-            for key, value in container_overrides.items():
-                if key in container and isinstance(container[key], list):
-                    container[key].extend(value)
-                elif key in container and isinstance(container[key], dict):
-                    container[key].update(value)
-                else:
-                    container[key] = value
-
-    def set_environment(self, env: typing.Dict[str, str]):
+            for key in ("environment", "secrets"):
+                if key in container:
+                    value = container[key]
+                    if not isinstance(value, Environment):
+                        value = Environment(value)
+                    try:
+                        container[key] = value.substitute(variables)
+                    except ValidationError as exc:
+                        raise ValidationError(
+                            [
+                                "Task definition %s, container %s, %s %s"
+                                % (self.family, container.get("name"), key, error)
+                                for error in exc.errors
+                            ]
+                        )
+
+    def apply_overrides(self, overrides):
+        """Apply overrides for all containers within this task definition.
+
+        See `merge.compile_overrides()` for how the values are merged.
+        """
+        merge.apply_plan(self.container_definitions, merge.compile_overrides(overrides))
+
+    def set_environment(self, env: typing.Mapping[str, str]):
         """Interpolate all the variables used in the task definition"""
+        if not isinstance(env, Environment):
+            env = Environment(env)
         for container in self.container_definitions:
             container["environment"] = env
 
-    def set_secrets(self, secrets: typing.Dict[str, str]):
+    def set_secrets(self, secrets: typing.Mapping[str, str]):
         """Interpolate all the secrets used in the task definition.
 
         Secrets will be fetched from the AWS Parameter store and injected in the
         environment variables during container startup
 
         """
+        if not isinstance(secrets, Environment):
+            secrets = Environment(secrets)
         for container in self.container_definitions:
             container["secrets"] = secrets
 
@@ -83,7 +204,7 @@ class TaskDefinition:
         return self._data == other._data
 
     def __repr__(self):
-        return json.dumps(self._data)
+        return json.dumps(self._data, default=dict, sort_keys=True)
 
     @property
     def tags(self) -> typing.List[typing.Dict[str, str]]:
@@ -157,50 +278,349 @@ class TaskDefinition:
     def network_mode(self, value):
         self._data["networkMode"] = value
 
+    @property
+    def cpu(self) -> typing.Optional[str]:
+        return self._data.get("cpu", None)
+
+    @property
+    def memory(self) -> typing.Optional[str]:
+        return self._data.get("memory", None)
+
+
+def canonicalize(payload: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    """Normalize a task definition payload for comparison.
+
+    The payload can be the output of `TaskDefinition.as_dict()` or the
+    `taskDefinition` returned by `ECS.Client.describe_task_definition`. Keys
+    which are not part of the task definition itself are removed, as are
+    empty values and values equal to the defaults ECS fills in, including the
+    `hostPort` of port mappings in awsvpc and host network mode (which ECS
+    sets to the `containerPort`). Environment variables and secrets are
+    sorted by name.
+
+    """
+    result = _strip_empty(
+        {k: v for k, v in payload.items() if k not in NON_CANONICAL_KEYS}
+    )
+    network_mode = result.get("networkMode", TASK_DEFAULTS["networkMode"])
+
+    for key, value in TASK_DEFAULTS.items():
+        if result.get(key) == value:
+            del result[key]
+
+    # ECS always returns the task level cpu/memory as strings
+    for key in ("cpu", "memory"):
+        if key in result:
+            result[key] = str(result[key])
+
+    for container in result.get("containerDefinitions", []):
+        for key, value in CONTAINER_DEFAULTS.items():
+            if container.get(key) == value:
+                del container[key]
+        for key in ("environment", "secrets"):
+            if key in container:
+                container[key] = sorted(container[key], key=operator.itemgetter("name"))
+        for mapping in container.get("portMappings", []):
+            for key, value in PORT_MAPPING_DEFAULTS.items():
+                if mapping.get(key) == value:
+                    del mapping[key]
+            if network_mode in ("awsvpc", "host") and mapping.get(
+                "hostPort"
+            ) == mapping.get("containerPort"):
+                mapping.pop("hostPort", None)
+    return result
+
+
+def payload_digest(payload: typing.Dict[str, typing.Any]) -> str:
+    """Return the sha256 hex digest of the canonical form of the payload."""
+    data = json.dumps(
+        canonicalize(payload), sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _strip_empty(value):
+    """Return a copy of the value without None's and empty lists/dicts."""
+    if isinstance(value, dict):
+        result = {}
+        for k, v in value.items():
+            v = _strip_empty(v)
+            if v is not None and v != [] and v != {}:
+                result[k] = v
+        return result
+    if isinstance(value, list):
+        return [_strip_empty(v) for v in value]
+    return value
+
+
+# The path to a string in a task definition and the compiled template of it.
+Placeholder = typing.Tuple[typing.Tuple[typing.Union[str, int], ...], Template]
+
+
+def find_placeholders(value, path=()) -> typing.List[Placeholder]:
+    """Return all strings in the document which need to be interpolated."""
+    if isinstance(value, str):
+        return [(path, Template(value))] if "$" in value else []
+
+    if isinstance(value, dict):
+        items: typing.Iterable = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return []
+
+    result = []
+    for key, item in items:
+        result.extend(find_placeholders(item, path + (key,)))
+    return result
+
+
+def check_overrides(
+    name: str, overrides: typing.Dict[str, typing.Dict[str, typing.Any]]
+) -> None:
+    """Check that the overrides don't contain placeholders which would be
+    registered as is, since only the environment and secrets of the
+    overrides are interpolated.
+
+    :raises ValidationError: naming the task definition and the keys
+    """
+    errors = []
+    for container_name, container_overrides in overrides.items():
+        for key, value in container_overrides.items():
+            if key in SERIALIZED_KEYS:
+                continue
+            for path, template in find_placeholders(value, (container_name, key)):
+                if "${" in template.template:
+                    errors.append(
+                        "Task definition %s, overrides.%s: placeholders are not "
+                        "interpolated in overrides"
+                        % (name, ".".join(str(key) for key in path))
+                    )
+    if errors:
+        raise ValidationError(errors)
+
+
+class TemplateCache:
+    """Cache the task definition templates read during a run.
+
+    Most configurations use a handful of templates for many task definitions,
+    so every template file is only read once. The cache is keyed by the
+    absolute path of the template and an entry is invalidated when the size or
+    modification time of the file changes.
+
+    Every call to :meth:`load` returns a new :class:`TaskDefinition` which can
+    be modified freely. It is created by decoding the cached document again,
+    which is considerably cheaper than a `copy.deepcopy` of the parsed data.
+
+    """
+
+    def __init__(self):
+        self._entries: typing.Dict[str, typing.Tuple[typing.Tuple[int, int], str]] = {}
+        self._derived: typing.Dict[
+            typing.Tuple[str, str], typing.Tuple[typing.Tuple[int, int], typing.Any]
+        ] = {}
+
+    def load(self, filename: str) -> TaskDefinition:
+        return TaskDefinition(json.loads(self._read(filename)[1]))
+
+    def placeholders(self, filename: str) -> typing.List[Placeholder]:
+        """Return the compiled placeholders of the template.
+
+        These are only computed once per template file.
+        """
+        return self._derive(
+            filename,
+            "placeholders",
+            lambda content: find_placeholders(json.loads(content)),
+        )
+
+    def digest(self, filename: str) -> str:
+        """Return the sha256 hex digest of the contents of the template."""
+        return self._derive(
+            filename,
+            "digest",
+            lambda content: hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        )
+
+    def _derive(
+        self, filename: str, kind: str, func: typing.Callable[[str], typing.Any]
+    ):
+        key, content = self._read(filename)
+        derived_key = (os.path.abspath(filename), kind)
+        entry = self._derived.get(derived_key)
+        if entry is None or entry[0] != key:
+            entry = self._derived[derived_key] = (key, func(content))
+        return entry[1]
+
+    def _read(self, filename: str) -> typing.Tuple[typing.Tuple[int, int], str]:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != key:
+            with open(path, "r") as fh:
+                content = fh.read()
+            entry = self._entries[path] = (key, content)
+        return entry
+
 
 def generate_task_definitions(
-    config, template_vars, base_path, output_path=None
+    config,
+    template_vars,
+    base_path,
+    output_path=None,
+    template_cache=None,
+    workers: int = 1,
+    worker_type: str = "thread",
+    cache: typing.Optional[GenerationCache] = None,
 ) -> typing.Dict[str, TaskDefinition]:
     """Generate the task definitions
 
+    When `workers` is larger than one the task definitions are generated in
+    parallel using a thread or process pool (`worker_type`). The result is
+    always returned in the order of the config, and if multiple task
+    definitions fail the error of the first one (in config order) is raised.
+
     :parameter config: The yaml config contents
     :parameter template_vars: Key-Value dict with template replacements
     :parameter base_path: The base path (location of the config file)
     :parameter output_path: Optional path to write the task definitions to.
+    :parameter template_cache: Optional `TemplateCache` to share between runs.
+    :parameter workers: Number of task definitions to generate in parallel.
+    :parameter worker_type: Either "thread" or "process".
+    :parameter cache: Optional `GenerationCache` to reuse task definitions
+                      generated by previous runs with the same inputs.
     :rtype dict:
 
     """
-    task_definitions = {}
+    if worker_type not in WORKER_TYPES:
+        raise ValueError("Invalid worker type %r" % worker_type)
 
-    for name, info in config["task_definitions"].items():
-        # Create a copy of the environment dict so that it can safely be
-        # modified.
-        env_vars = copy.deepcopy(config.get("environment", {}))
+    interpolation = config.get("interpolation", "image")
+    if interpolation not in INTERPOLATION_MODES:
+        raise ValueError("Invalid interpolation mode %r" % interpolation)
+
+    if template_cache is None:
+        template_cache = TemplateCache()
 
-        # Environment groups
+    # Task definitions using the same environment group share the same
+    # (immutable) environment.
+    environments: typing.Dict[typing.Optional[str], Environment] = {}
+
+    jobs = []
+    for name, info in config["task_definitions"].items():
         env_group = info.get("environment_group")
-        if env_group:
-            env_vars.update(config["environment_groups"][env_group])
-
-        overrides = info.get("overrides", {})
-        definition = generate_task_definition(
-            filename=info["template"],
-            environment=env_vars,
-            template_vars=template_vars,
-            overrides=overrides,
-            name=name,
-            base_path=base_path,
-            task_role_arn=info.get("task_role_arn"),
-            secrets=config.get("secrets", {}),
-            execution_role_arn=info.get("execution_role_arn"),
+        env_vars = environments.get(env_group)
+        if env_vars is None:
+            env_vars = Environment(config.get("environment", {}))
+            if env_group:
+                env_vars = env_vars.with_layer(config["environment_groups"][env_group])
+            environments[env_group] = env_vars
+
+        jobs.append(
+            {
+                "filename": info["template"],
+                "environment": env_vars,
+                "template_vars": template_vars,
+                "overrides": info.get("overrides", {}),
+                "name": name,
+                "base_path": base_path,
+                "task_role_arn": info.get("task_role_arn"),
+                "secrets": config.get("secrets") or {},
+                "execution_role_arn": info.get("execution_role_arn"),
+                "interpolation": interpolation,
+            }
         )
-        if output_path:
-            write_task_definition(name, definition, output_path)
-        task_definitions[name] = definition
 
+    # Reuse the task definitions from the cache which were generated with the
+    # same inputs.
+    task_definitions: typing.Dict[str, TaskDefinition] = {}
+    keys: typing.Dict[str, str] = {}
+    if cache is not None:
+        input_keys: typing.Dict[int, str] = {}
+
+        def input_key(value) -> str:
+            if id(value) not in input_keys:
+                input_keys[id(value)] = make_key(value)
+            return input_keys[id(value)]
+
+        for job in jobs:
+            filename = job["filename"]
+            if base_path:
+                filename = os.path.join(base_path, filename)
+
+            key = keys[job["name"]] = make_key(
+                {
+                    **job,
+                    "filename": template_cache.digest(filename),
+                    "base_path": None,
+                    "environment": input_key(job["environment"]),
+                    "secrets": input_key(job["secrets"]),
+                }
+            )
+            data = cache.get(key)
+            if data is not None:
+                task_definitions[job["name"]] = TaskDefinition(data)
+
+    pending = [job for job in jobs if job["name"] not in task_definitions]
+    definitions = _generate(pending, template_cache, workers, worker_type)
+    for job, definition in zip(pending, definitions):
+        task_definitions[job["name"]] = definition
+        if cache is not None:
+            cache.set(keys[job["name"]], definition._data)
+
+    if cache is not None and pending:
+        cache.evict()
+
+    # Keep the order of the config
+    task_definitions = {job["name"]: task_definitions[job["name"]] for job in jobs}
+    if output_path:
+        write_task_definitions(task_definitions, output_path, workers=workers)
     return task_definitions
 
 
+def _generate(
+    jobs: typing.List[typing.Dict[str, typing.Any]],
+    template_cache: TemplateCache,
+    workers: int,
+    worker_type: str,
+) -> typing.List[TaskDefinition]:
+    if workers > 1 and len(jobs) > 1:
+        if worker_type == "process":
+            # Every worker process uses its own template cache
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_process_worker
+            ) as executor:
+                return list(executor.map(_generate_in_process, jobs))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(
+                    lambda job: generate_task_definition(
+                        template_cache=template_cache, **job
+                    ),
+                    jobs,
+                )
+            )
+
+    return [
+        generate_task_definition(template_cache=template_cache, **job) for job in jobs
+    ]
+
+
+_process_template_cache: typing.Optional[TemplateCache] = None
+
+
+def _init_process_worker() -> None:
+    global _process_template_cache
+    _process_template_cache = TemplateCache()
+
+
+def _generate_in_process(job: typing.Dict[str, typing.Any]) -> TaskDefinition:
+    return generate_task_definition(template_cache=_process_template_cache, **job)
+
+
 def generate_task_definition(
     filename: str,
     environment: typing.Dict[str, str],
@@ -211,13 +631,16 @@ def generate_task_definition(
     task_role_arn=None,
     secrets: typing.Dict[str, str] = {},
     execution_role_arn=None,
+    template_cache: typing.Optional[TemplateCache] = None,
+    interpolation: str = "image",
 ) -> TaskDefinition:
     """Generate the task definitions."""
     if base_path:
         filename = os.path.join(base_path, filename)
 
-    with open(filename, "r") as fh:
-        task_definition = TaskDefinition.load(fh)
+    if template_cache is None:
+        template_cache = TemplateCache()
+    task_definition = template_cache.load(filename)
 
     task_definition.family = name
     if task_role_arn:
@@ -240,14 +663,63 @@ def generate_task_definition(
     task_definition.set_environment(environment)
     if secrets:
         task_definition.set_secrets(secrets)
-    task_definition.apply_variables(template_vars)
-    task_definition.apply_overrides(overrides)
+    if interpolation == "document":
+        # The template is interpolated before the overrides are applied, of
+        # the overrides only the environment variables and secrets are.
+        check_overrides(name, overrides)
+        task_definition.interpolate(
+            template_vars, template_cache.placeholders(filename)
+        )
+        task_definition.apply_overrides(overrides)
+        task_definition.interpolate_environment(template_vars)
+    else:
+        task_definition.apply_variables(template_vars)
+        task_definition.apply_overrides(overrides)
     task_definition.tags = [{"key": "createdBy", "value": "ecs-deplojo"}]
 
     return task_definition
 
 
-def write_task_definition(name: str, definition: TaskDefinition, output_path) -> None:
+def write_task_definitions(
+    task_definitions: typing.Dict[str, TaskDefinition], output_path, workers: int = 1
+) -> int:
+    """Write the task definitions to `<output_path>/<name>.json`.
+
+    The files are written with a thread pool when `workers` is larger than
+    one. Returns the number of files which were actually (re)written.
+    """
+    if workers > 1 and len(task_definitions) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            written = list(
+                executor.map(
+                    lambda item: write_task_definition(item[0], item[1], output_path),
+                    task_definitions.items(),
+                )
+            )
+    else:
+        written = [
+            write_task_definition(name, definition, output_path)
+            for name, definition in task_definitions.items()
+        ]
+    return sum(written)
+
+
+def write_task_definition(name: str, definition: TaskDefinition, output_path) -> bool:
+    """Write the task definition to `<output_path>/<name>.json`.
+
+    Returns False when the file already has the same content, in which case it
+    is left untouched so that its modification time doesn't change.
+    """
     filename = os.path.join(output_path, "%s.json" % name)
-    with open(filename, "w") as fh:
-        json.dump(definition.as_dict(), fh, indent=4)
+    return utils.write_file(filename, json.dumps(definition.as_dict(), indent=4))
+
+
+def write_manifest(
+    task_definitions: typing.Dict[str, TaskDefinition], filename
+) -> bool:
+    """Write a JSON file with the digest of every task definition."""
+    manifest = {
+        name: {"file": "%s.json" % name, "digest": definition.digest()}
+        for name, definition in task_definitions.items()
+    }
+    return utils.write_file(filename, json.dumps(manifest, indent=4, sort_keys=True))
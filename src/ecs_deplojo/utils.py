@@ -1,3 +1,7 @@
+import hashlib
+import os
+import secrets
+import stat
 import typing
 
 
@@ -32,3 +36,49 @@ def describe_services(
         )
         result.extend(response["services"])
     return result
+
+
+def parse_int(value) -> typing.Optional[int]:
+    """Return the task level cpu/memory as int, these can also be strings
+    like '1 vCPU' in which case None is returned."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def write_file(filename: str, content: str) -> bool:
+    """Atomically replace the file with the given content.
+
+    Nothing is written when the hash of the existing file matches the hash of
+    the new content. Returns True if the file was written. An existing file
+    keeps its permissions, new files get the default permissions (0o666
+    minus the umask).
+    """
+    data = content.encode("utf-8")
+    mode = None
+    try:
+        with open(filename, "rb") as fh:
+            if hashlib.sha256(fh.read()).digest() == hashlib.sha256(data).digest():
+                return False
+            mode = stat.S_IMODE(os.fstat(fh.fileno()).st_mode)
+    except FileNotFoundError:
+        pass
+
+    # Unlike tempfile.mkstemp() the file is created with mode 0o666, so the
+    # umask of the process is applied by the OS
+    tmp_filename = os.path.join(
+        os.path.dirname(filename),
+        ".%s.%s.tmp" % (os.path.basename(filename), secrets.token_hex(4)),
+    )
+    fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            if mode is not None:
+                os.fchmod(fh.fileno(), mode)
+            fh.write(data)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+    return True
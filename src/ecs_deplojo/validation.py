@@ -0,0 +1,299 @@
+import functools
+import json
+import typing
+
+import botocore.session
+from botocore.validate import ParamValidator
+
+from ecs_deplojo.exceptions import ValidationError
+from ecs_deplojo.logger import logger
+from ecs_deplojo.readiness import READINESS_MODES
+from ecs_deplojo.task_definitions import INTERPOLATION_MODES, TaskDefinition
+from ecs_deplojo.utils import parse_int
+
+# ECS rejects task definitions larger than 64 KiB
+MAX_TASK_DEFINITION_SIZE = 64 * 1024
+
+Validator = typing.Callable[[typing.Any, str, typing.List[str]], None]
+
+
+def validate_config(config: typing.Any) -> None:
+    """Validate the structure of the deplojo config and the references
+    between its sections.
+
+    :raises ValidationError: with all errors found
+    """
+    errors: typing.List[str] = []
+    CONFIG_SCHEMA(config, "config", errors)
+    if errors:
+        raise ValidationError(errors)
+
+    task_definitions = config["task_definitions"]
+    environment_groups = config.get("environment_groups") or {}
+    for name, info in task_definitions.items():
+        group = info.get("environment_group")
+        if group and group not in environment_groups:
+            errors.append(
+                "Unknown environment group %r for task definition %r" % (group, name)
+            )
+
+    def check_reference(value: str, path: str) -> None:
+        if value not in task_definitions:
+            errors.append("%s: unknown task definition %r" % (path, value))
+
+    for name, service in config["services"].items():
+        check_reference(service["task_definition"], "services.%s" % name)
+    for name, task in config.get("scheduled_tasks", {}).items():
+        if task.get("task_definition"):
+            check_reference(task["task_definition"], "scheduled_tasks.%s" % name)
+    for key in ("before_deploy", "after_deploy"):
+        for i, task in enumerate(config.get(key, [])):
+            check_reference(task["task_definition"], "%s[%d]" % (key, i))
+
+    if errors:
+        raise ValidationError(errors)
+
+
+def validate_task_definitions(
+    config: typing.Dict[str, typing.Any],
+    task_definitions: typing.Dict[str, TaskDefinition],
+    service_model=None,
+) -> None:
+    """Validate the generated task definitions.
+
+    The register payloads are validated against the ECS service model of
+    botocore (pass `connection.ecs.meta.service_model` to reuse the already
+    loaded model). Also checks the overrides in the config, the size of the
+    payloads and the cpu/memory of the containers.
+
+    :raises ValidationError: with all errors found
+    """
+    if service_model is None:
+        service_model = _load_service_model()
+    input_shape = service_model.operation_model("RegisterTaskDefinition").input_shape
+    container_keys = set(service_model.shape_for("ContainerDefinition").members)
+    validator = ParamValidator()
+
+    # The environment variables are moved to S3 before registering
+    offload_environment = bool(config.get("environment_files"))
+
+    errors: typing.List[str] = []
+    for name, task_definition in task_definitions.items():
+        payload = task_definition.as_dict()
+        for key in ("name", "arn", "revision"):
+            payload.pop(key, None)
+
+        report = validator.validate(payload, input_shape)
+        if report.has_errors():
+            errors.append(
+                "Task definition %r is invalid: %s" % (name, report.generate_report())
+            )
+
+        size = _payload_size(payload, offload_environment)
+        if size > MAX_TASK_DEFINITION_SIZE:
+            errors.append(
+                "Task definition %r is %d bytes, the maximum is %d bytes"
+                % (name, size, MAX_TASK_DEFINITION_SIZE)
+            )
+
+        containers = payload.get("containerDefinitions", [])
+        container_names = {c.get("name") for c in containers}
+        overrides = config["task_definitions"].get(name, {}).get("overrides") or {}
+        for container_name, container_overrides in overrides.items():
+            if container_name not in container_names:
+                errors.append(
+                    "Overrides of task definition %r reference unknown container %r"
+                    % (name, container_name)
+                )
+            for key in container_overrides:
+                if key not in container_keys:
+                    errors.append(
+                        "Overrides of task definition %r contain unknown key %r "
+                        "for container %r" % (name, key, container_name)
+                    )
+
+        errors.extend(_check_resources(name, payload))
+
+    if errors:
+        raise ValidationError(errors)
+
+
+def _payload_size(payload: typing.Dict[str, typing.Any], offload_environment: bool):
+    if offload_environment:
+        payload = {
+            **payload,
+            "containerDefinitions": [
+                {k: v for k, v in container.items() if k != "environment"}
+                for container in payload.get("containerDefinitions", [])
+            ],
+        }
+    return len(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def _check_resources(name: str, payload: typing.Dict[str, typing.Any]) -> list:
+    """Check the cpu and memory of the containers against the task."""
+    errors = []
+    containers = payload.get("containerDefinitions", [])
+    task_cpu = parse_int(payload.get("cpu"))
+    task_memory = parse_int(payload.get("memory"))
+
+    if task_cpu is not None:
+        total_cpu = sum(c.get("cpu") or 0 for c in containers)
+        if total_cpu > task_cpu:
+            errors.append(
+                "Containers of task definition %r use %d cpu units, the task only "
+                "has %d" % (name, total_cpu, task_cpu)
+            )
+
+    total_memory = 0
+    for container in containers:
+        memory = container.get("memory")
+        reservation = container.get("memoryReservation")
+        if memory is None and reservation is None and task_memory is None:
+            errors.append(
+                "Container %r of task definition %r requires memory or "
+                "memoryReservation" % (container.get("name"), name)
+            )
+        if memory is not None and reservation is not None and reservation > memory:
+            errors.append(
+                "Container %r of task definition %r has a memoryReservation larger "
+                "than its memory" % (container.get("name"), name)
+            )
+        total_memory += reservation if reservation is not None else memory or 0
+
+    if task_memory is not None and total_memory > task_memory:
+        errors.append(
+            "Containers of task definition %r reserve %d MiB memory, the task only "
+            "has %d MiB" % (name, total_memory, task_memory)
+        )
+    return errors
+
+
+@functools.lru_cache(maxsize=None)
+def _load_service_model():
+    return botocore.session.get_session().get_service_model("ecs")
+
+
+def _type(expected: typing.Tuple[type, ...], description: str) -> Validator:
+    def validate(value, path, errors):
+        if not isinstance(value, expected):
+            errors.append("%s: expected %s" % (path, description))
+
+    return validate
+
+
+def _enum(choices: typing.Sequence[str]) -> Validator:
+    def validate(value, path, errors):
+        if value not in choices:
+            errors.append("%s: expected one of %s" % (path, ", ".join(choices)))
+
+    return validate
+
+
+def _mapping(values: typing.Optional[Validator] = None) -> Validator:
+    def validate(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append("%s: expected a mapping" % path)
+        elif values:
+            for key, item in value.items():
+                values(item, "%s.%s" % (path, key), errors)
+
+    return validate
+
+
+def _optional(validator: Validator) -> Validator:
+    """Accept None as well, an empty section in YAML loads as None."""
+
+    def validate(value, path, errors):
+        if value is not None:
+            validator(value, path, errors)
+
+    return validate
+
+
+def _list(items: Validator) -> Validator:
+    def validate(value, path, errors):
+        if not isinstance(value, list):
+            errors.append("%s: expected a list" % path)
+            return
+        for i, item in enumerate(value):
+            items(item, "%s[%d]" % (path, i), errors)
+
+    return validate
+
+
+def _record(
+    fields: typing.Dict[str, Validator],
+    required: typing.Sequence[str] = (),
+    warn_unknown: bool = True,
+) -> Validator:
+    """Validate a mapping with the given fields.
+
+    Unknown keys are ignored, with a warning unless `warn_unknown` is False.
+    """
+
+    def validate(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append("%s: expected a mapping" % path)
+            return
+        for key in required:
+            if key not in value:
+                errors.append("%s: missing required key %r" % (path, key))
+        for key, item in value.items():
+            if key in fields:
+                fields[key](item, "%s.%s" % (path, key), errors)
+            elif warn_unknown:
+                logger.warning("%s: unknown key %r is ignored", path, key)
+
+    return validate
+
+
+_string = _type((str,), "a string")
+# Null values are passed to the containers as the string 'None'
+_scalar = _type((str, int, float, bool, type(None)), "a scalar value")
+_environment = _mapping(_scalar)
+_one_off_task = _record(
+    {"task_definition": _string, "container": _string, "command": _string},
+    required=("task_definition", "container", "command"),
+)
+
+# The top level keys are not restricted so YAML anchors can be defined there
+CONFIG_SCHEMA = _record(
+    {
+        "cluster_name": _string,
+        "interpolation": _enum(INTERPOLATION_MODES),
+        "readiness": _enum(READINESS_MODES),
+        "capacity_aware_rollout": _type((bool,), "a boolean"),
+        "pin_image_digests": _type((bool,), "a boolean"),
+        "check_secrets": _type((bool,), "a boolean"),
+        "discover_scheduled_tasks": _type((bool,), "a boolean"),
+        "skip_unchanged_services": _type((bool,), "a boolean"),
+        "lightweight_polling": _type((bool,), "a boolean"),
+        "environment": _environment,
+        "environment_groups": _optional(_mapping(_environment)),
+        "secrets": _optional(_mapping(_string)),
+        "environment_files": _record(
+            {"bucket": _string, "prefix": _string}, required=("bucket",)
+        ),
+        "task_definitions": _mapping(
+            _record(
+                {
+                    "template": _string,
+                    "environment_group": _string,
+                    "task_role_arn": _string,
+                    "execution_role_arn": _string,
+                    "overrides": _mapping(_mapping()),
+                },
+                required=("template",),
+            )
+        ),
+        "services": _mapping(
+            _record({"task_definition": _string}, required=("task_definition",))
+        ),
+        "scheduled_tasks": _mapping(_record({"task_definition": _string})),
+        "before_deploy": _list(_one_off_task),
+        "after_deploy": _list(_one_off_task),
+    },
+    required=("cluster_name", "task_definitions", "services"),
+    warn_unknown=False,
+)
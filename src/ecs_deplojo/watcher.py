@@ -0,0 +1,88 @@
+import typing
+
+from ecs_deplojo.connection import Connection
+from ecs_deplojo.logger import logger
+
+# The statuses of service deployments which are still rolling out
+ACTIVE_STATUSES = [
+    "PENDING",
+    "IN_PROGRESS",
+    "ROLLBACK_REQUESTED",
+    "ROLLBACK_IN_PROGRESS",
+]
+
+# The maximum number of arns per describe_service_deployments call
+DESCRIBE_BATCH_SIZE = 20
+
+
+def supports_service_deployments(connection: Connection) -> bool:
+    """Return if the ECS client knows the service deployments API."""
+    operations = connection.ecs.meta.service_model.operation_names
+    return (
+        "ListServiceDeployments" in operations
+        and "DescribeServiceDeployments" in operations
+    )
+
+
+class ServiceDeploymentsWatcher:
+    """Track the rollouts of services via the service deployments API.
+
+    The active service deployments are listed once per service, after that
+    only their status is requested with `describe_service_deployments` (20
+    per call). The responses are a fraction of the size of the service
+    documents returned by `describe_services`, which include up to 100
+    events per service.
+    """
+
+    def __init__(
+        self,
+        connection: Connection,
+        cluster_name: str,
+        service_names: typing.Iterable[str],
+    ):
+        self.connection = connection
+        self.cluster_name = cluster_name
+        self.service_names = list(service_names)
+        self._deployments: typing.Optional[typing.Dict[str, str]] = None
+
+    def in_progress(self) -> typing.Set[str]:
+        """Return the names of the services which are still rolling out."""
+        if self._deployments is None:
+            self._deployments = self._list_deployments()
+
+        arns = sorted(self._deployments)
+        for i in range(0, len(arns), DESCRIBE_BATCH_SIZE):
+            response = self.connection.ecs.describe_service_deployments(
+                serviceDeploymentArns=arns[i : i + DESCRIBE_BATCH_SIZE]
+            )
+            for deployment in response["serviceDeployments"]:
+                if deployment["status"] in ACTIVE_STATUSES:
+                    continue
+                service_name = self._deployments.pop(deployment["serviceDeploymentArn"])
+                if deployment["status"] != "SUCCESSFUL":
+                    logger.warning(
+                        "Deployment of %s ended with status %s: %s",
+                        service_name,
+                        deployment["status"],
+                        deployment.get("statusReason", "-"),
+                        extra={"phase": "wait", "service": service_name},
+                    )
+        return set(self._deployments.values())
+
+    def _list_deployments(self) -> typing.Dict[str, str]:
+        """Return the service name per arn of the active service deployments."""
+        result = {}
+        for service_name in self.service_names:
+            kwargs = {
+                "cluster": self.cluster_name,
+                "service": service_name,
+                "status": ACTIVE_STATUSES,
+            }
+            while True:
+                response = self.connection.ecs.list_service_deployments(**kwargs)
+                for deployment in response["serviceDeployments"]:
+                    result[deployment["serviceDeploymentArn"]] = service_name
+                if not response.get("nextToken"):
+                    break
+                kwargs["nextToken"] = response["nextToken"]
+        return result
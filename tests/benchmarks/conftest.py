@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+TEMPLATE = {
+    "family": "default",
+    "volumes": [],
+    "containerDefinitions": [
+        {
+            "name": "web-%d" % i,
+            "image": "${image}",
+            "essential": True,
+            "command": ["hello", "world"],
+            "memory": 256,
+            "cpu": 0,
+            "portMappings": [{"containerPort": 8080, "hostPort": 0}],
+        }
+        for i in range(3)
+    ],
+}
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """Return a factory building a config with `num` task definitions.
+
+    The task definitions are spread over three template files, like most real
+    world configurations.
+    """
+
+    def factory(num, num_env=50):
+        templates = []
+        for i in range(3):
+            path = tmp_path / ("template-%d.json" % i)
+            path.write_text(json.dumps(TEMPLATE))
+            templates.append(path.name)
+
+        return {
+            "cluster_name": "default",
+            "environment": {"VAR_%d" % i: "value-%d" % i for i in range(num_env)},
+            "environment_groups": {
+                "group-%d" % i: {"GROUP": "group-%d" % i} for i in range(5)
+            },
+            "task_definitions": {
+                "task-def-%d" % i: {
+                    "template": templates[i % 3],
+                    "environment_group": "group-%d" % (i % 5),
+                    "overrides": {"web-0": {"memory": 512}},
+                }
+                for i in range(num)
+            },
+        }
+
+    return factory
@@ -0,0 +1,23 @@
+import pytest
+
+from ecs_deplojo import task_definitions
+
+
+@pytest.mark.parametrize("num", [10, 100, 1000])
+@pytest.mark.parametrize(
+    "workers,worker_type", [(1, "thread"), (4, "thread"), (4, "process")]
+)
+def test_generate_task_definitions(
+    benchmark, make_config, tmp_path, num, workers, worker_type
+):
+    config = make_config(num)
+
+    result = benchmark(
+        task_definitions.generate_task_definitions,
+        config,
+        template_vars={"image": "my-docker-image:1.0"},
+        base_path=str(tmp_path),
+        workers=workers,
+        worker_type=worker_type,
+    )
+    assert len(result) == num
@@ -0,0 +1,67 @@
+import pytest
+
+from ecs_deplojo.environment import Environment
+from ecs_deplojo.task_definitions import TaskDefinition
+
+
+@pytest.mark.parametrize("num_env", [100, 2000])
+@pytest.mark.parametrize("shared", [True, False], ids=["environment", "dict"])
+def test_as_dict(benchmark, num_env, shared):
+    environment = {"VAR_%d" % i: "value-%d" % i for i in range(num_env)}
+    secrets = {"SECRET_%d" % i: "/secret/%d" % i for i in range(num_env // 10)}
+    if shared:
+        environment, secrets = Environment(environment), Environment(secrets)
+
+    definition = TaskDefinition(
+        {
+            "family": "default",
+            "containerDefinitions": [
+                {
+                    "name": "web-%d" % i,
+                    "image": "my-docker-image:1.0",
+                    "environment": environment,
+                    "secrets": secrets,
+                }
+                for i in range(4)
+            ],
+        }
+    )
+
+    result = benchmark(definition.as_dict)
+    assert len(result["containerDefinitions"][0]["environment"]) == num_env
+
+
+@pytest.mark.parametrize("num_containers", [4, 50])
+def test_apply_overrides(benchmark, num_containers):
+    containers = [
+        {
+            "name": "web-%d" % i,
+            "image": "my-docker-image:1.0",
+            "memory": 256,
+            "environment": Environment({"VAR_%d" % j: "value" for j in range(100)}),
+            "portMappings": [{"containerPort": 8080, "hostPort": 0}],
+            "mountPoints": [{"containerPath": "/data", "sourceVolume": "data"}],
+        }
+        for i in range(num_containers)
+    ]
+    overrides = {
+        "web-%d" % i: {
+            "memory": 512,
+            "environment": {"EXTRA": "value"},
+            "portMappings": [{"containerPort": 8080, "hostPort": 80}],
+            "mountPoints": [{"containerPath": "/cache", "sourceVolume": "cache"}],
+            "logConfiguration": {"logDriver": "awslogs", "options": {"a": "b"}},
+        }
+        for i in range(num_containers)
+    }
+
+    def setup():
+        definition = TaskDefinition(
+            {"family": "default", "containerDefinitions": [dict(c) for c in containers]}
+        )
+        return (overrides,), {"definition": definition}
+
+    def apply(overrides, definition):
+        definition.apply_overrides(overrides)
+
+    benchmark.pedantic(apply, setup=setup, rounds=200)
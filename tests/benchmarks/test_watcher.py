@@ -0,0 +1,61 @@
+import datetime
+
+import pytest
+
+from ecs_deplojo import utils
+from ecs_deplojo.deployment import extract_new_event_messages
+
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.mark.parametrize("num_services", [100, 500])
+def test_extract_new_event_messages(benchmark, num_services):
+    services = [
+        {
+            "serviceName": "service-%d" % i,
+            "events": [
+                {
+                    "id": "event-%d-%d" % (i, j),
+                    "createdAt": START + datetime.timedelta(seconds=100 - j),
+                    "message": "(service service-%d) has reached a steady state." % i,
+                }
+                for j in range(100)
+            ],
+        }
+        for i in range(num_services)
+    ]
+
+    def setup():
+        # Half of the events are new
+        last_timestamps = {
+            service["serviceName"]: START + datetime.timedelta(seconds=50)
+            for service in services
+        }
+        return (services, last_timestamps, set()), {}
+
+    def extract(*args):
+        return list(extract_new_event_messages(*args))
+
+    result = benchmark.pedantic(extract, setup=setup, rounds=20)
+    assert len(result) == num_services * 50
+
+
+@pytest.mark.parametrize("num_services", [10, 100])
+def test_describe_services(benchmark, cluster, connection, num_services):
+    task_definition = connection.ecs.register_task_definition(
+        family="web",
+        containerDefinitions=[{"name": "web", "image": "web:1.0", "memory": 128}],
+    )["taskDefinition"]["taskDefinitionArn"]
+    names = {"service-%d" % i for i in range(num_services)}
+    for name in names:
+        connection.ecs.create_service(
+            cluster="default",
+            serviceName=name,
+            taskDefinition=task_definition,
+            desiredCount=1,
+        )
+
+    result = benchmark(
+        utils.describe_services, connection.ecs, cluster="default", services=names
+    )
+    assert len(result) == num_services
@@ -0,0 +1,75 @@
+import os
+
+from ecs_deplojo import task_definitions
+from ecs_deplojo.cache import GenerationCache, make_key
+
+
+def test_make_key():
+    assert make_key({"a": 1, "b": 2}) == make_key({"b": 2, "a": 1})
+    assert make_key({"a": 1}) != make_key({"a": 2})
+
+
+def test_generation_cache(tmpdir):
+    cache = GenerationCache(tmpdir.join("cache").strpath)
+    assert cache.get("key") is None
+
+    cache.set("key", {"family": "default"})
+    assert cache.get("key") == {"family": "default"}
+
+
+def test_generation_cache_evict(tmpdir):
+    cache = GenerationCache(tmpdir.join("cache").strpath, max_size=120)
+    for i in range(3):
+        cache.set("key-%d" % i, {"value": "x" * 40})
+        os.utime(cache._filename("key-%d" % i), ns=(i, i))
+
+    # Reading an entry marks it as recently used
+    assert cache.get("key-0")
+
+    assert cache.evict() == 1
+    assert cache.get("key-1") is None
+    assert cache.get("key-0") and cache.get("key-2")
+
+
+def test_generate_task_definitions_cached(tmpdir, monkeypatch):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        '{"family": "default", "containerDefinitions": ['
+        '{"name": "web-1", "image": "${image}"}]}'
+    )
+    config = {
+        "environment": {"DATABASE_URL": "postgresql://"},
+        "task_definitions": {
+            "task-def-1": {"template": filename.strpath},
+            "task-def-2": {"template": filename.strpath},
+        },
+    }
+    cache = GenerationCache(tmpdir.join("cache").strpath)
+
+    expected = task_definitions.generate_task_definitions(
+        config, {"image": "my-docker-image:1.0"}, None, cache=cache
+    )
+
+    generated = []
+    generate = task_definitions.generate_task_definition
+    monkeypatch.setattr(
+        task_definitions,
+        "generate_task_definition",
+        lambda **kwargs: generated.append(kwargs["name"]) or generate(**kwargs),
+    )
+
+    result = task_definitions.generate_task_definitions(
+        config, {"image": "my-docker-image:1.0"}, None, cache=cache
+    )
+    assert generated == []
+    assert {k: v.as_dict() for k, v in result.items()} == {
+        k: v.as_dict() for k, v in expected.items()
+    }
+
+    # Changing one of the inputs regenerates the task definitions
+    config["task_definitions"]["task-def-2"]["overrides"] = {"web-1": {"cpu": 10}}
+    result = task_definitions.generate_task_definitions(
+        config, {"image": "my-docker-image:1.0"}, None, cache=cache
+    )
+    assert generated == ["task-def-2"]
+    assert list(result) == ["task-def-1", "task-def-2"]
@@ -0,0 +1,71 @@
+from ecs_deplojo import capacity
+from ecs_deplojo.capacity import Resources
+from ecs_deplojo.task_definitions import TaskDefinition
+
+
+def test_sample_capacity(connection):
+    assert capacity.sample_capacity(connection, "default") == [Resources(4096, 7482)]
+
+
+def test_task_size_containers():
+    task_definition = TaskDefinition(
+        {
+            "containerDefinitions": [
+                {"name": "a", "cpu": 256, "memory": 512},
+                {"name": "b", "cpu": 0, "memory": 512, "memoryReservation": 128},
+                {"name": "c"},
+            ]
+        }
+    )
+    assert capacity.task_size(task_definition) == Resources(256, 640)
+
+
+def test_task_size_task_level():
+    task_definition = TaskDefinition(
+        {
+            "cpu": "1024",
+            "memory": "2 GB",
+            "containerDefinitions": [{"name": "a", "cpu": 256, "memory": 512}],
+        }
+    )
+    assert capacity.task_size(task_definition) == Resources(1024, 512)
+
+
+def test_surge_tasks():
+    assert capacity.surge_tasks({"desiredCount": 3}) == 3
+    assert (
+        capacity.surge_tasks(
+            {"desiredCount": 3, "deploymentConfiguration": {"maximumPercent": 150}}
+        )
+        == 1
+    )
+    assert capacity.surge_tasks({"desiredCount": 3, "launchType": "FARGATE"}) == 0
+    assert (
+        capacity.surge_tasks(
+            {"desiredCount": 3, "capacityProviderStrategy": [{"capacityProvider": "x"}]}
+        )
+        == 0
+    )
+
+
+def test_plan_batch():
+    free = [Resources(1024, 1024), Resources(1024, 1024)]
+    requests = [
+        ("web", Resources(512, 512), 2),
+        ("worker", Resources(1024, 1024), 1),
+        ("api", Resources(512, 512), 2),
+        ("cron", Resources(0, 0), 0),
+    ]
+    # web takes the first instance, worker the second and api needs to wait
+    assert capacity.plan_batch(requests, free) == (["web", "worker", "cron"], ["api"])
+
+
+def test_plan_batch_per_instance():
+    # The total capacity is enough, but a task doesn't fit on one instance
+    free = [Resources(512, 512), Resources(512, 512)]
+    requests = [("web", Resources(1024, 512), 1), ("api", Resources(1024, 512), 1)]
+    assert capacity.plan_batch(requests, free) == (["web"], ["api"])
+
+
+def test_plan_batch_empty():
+    assert capacity.plan_batch([], []) == ([], [])
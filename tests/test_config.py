@@ -0,0 +1,46 @@
+import pytest
+
+from ecs_deplojo import config
+
+
+def test_load_config(tmpdir):
+    tmpdir.join("environment.yml").write("DATABASE_URL: postgresql://\n")
+    tmpdir.mkdir("shared").join("secrets.yml").write(
+        "API_KEY: /api-key\nOTHER: !include ../environment.yml\n"
+    )
+    filename = tmpdir.join("config.yml")
+    filename.write(
+        "cluster_name: default\n"
+        "environment: !include environment.yml\n"
+        "secrets: !include shared/secrets.yml\n"
+    )
+
+    result = config.load_config(filename.strpath)
+    assert result == {
+        "cluster_name": "default",
+        "environment": {"DATABASE_URL": "postgresql://"},
+        "secrets": {
+            "API_KEY": "/api-key",
+            "OTHER": {"DATABASE_URL": "postgresql://"},
+        },
+    }
+
+    # Every call returns a copy
+    result["environment"]["DEBUG"] = "true"
+    assert config.load_config(filename.strpath)["environment"] == {
+        "DATABASE_URL": "postgresql://"
+    }
+
+    # Changes to included files are picked up
+    tmpdir.join("environment.yml").write("DATABASE_URL: mysql://\n")
+    assert config.load_config(filename.strpath)["environment"] == {
+        "DATABASE_URL": "mysql://"
+    }
+
+
+def test_load_config_recursive_include(tmpdir):
+    filename = tmpdir.join("config.yml")
+    filename.write("environment: !include config.yml\n")
+
+    with pytest.raises(ValueError, match="Recursive !include"):
+        config.load_config(filename.strpath)
@@ -0,0 +1,13 @@
+from ecs_deplojo.connection import Connection
+
+
+def test_optional_clients_are_lazy(cluster):
+    connection = Connection()
+    assert "s3" not in vars(connection)
+
+    assert connection.s3 is connection.s3
+    assert connection.s3.meta.service_model.service_name == "s3"
+    assert connection.ssm is not connection.regional_client("ssm", "us-east-1")
+    assert connection.regional_client("ssm", "us-east-1").meta.region_name == (
+        "us-east-1"
+    )
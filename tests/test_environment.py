@@ -0,0 +1,44 @@
+import copy
+
+from ecs_deplojo.environment import Environment, as_list
+
+
+def test_environment_layers():
+    env = Environment({"A": "1", "B": "2"}, {"B": "3"}, {})
+    assert dict(env) == {"A": "1", "B": "3"}
+    assert env == {"A": "1", "B": "3"}
+
+    overridden = env.with_layer({"C": 4})
+    assert overridden == {"A": "1", "B": "3", "C": 4}
+    assert env == {"A": "1", "B": "3"}
+    assert env.with_layer({}) is env
+
+
+def test_environment_is_shared():
+    env = Environment({"A": "1"})
+    assert copy.copy(env) is env
+    assert copy.deepcopy(env) is env
+
+
+def test_environment_as_list():
+    env = Environment({"DEBUG": True, "AWS_REGION": "eu-west-1"})
+    expected = [
+        {"name": "AWS_REGION", "value": "eu-west-1"},
+        {"name": "DEBUG", "value": "True"},
+    ]
+    assert env.as_list() is env.as_list()
+    assert as_list(env) == expected
+    assert as_list(dict(env)) == expected
+    assert as_list({"SECRET": "/path"}, "valueFrom") == [
+        {"name": "SECRET", "valueFrom": "/path"}
+    ]
+
+
+def test_environment_substitute():
+    env = Environment({"URL": "https://${domain}/", "DEBUG": False, "PRICE": "$$5"})
+    result = env.substitute({"domain": "example.com"})
+    assert result == {"URL": "https://example.com/", "DEBUG": False, "PRICE": "$5"}
+    assert env.substitute({"domain": "example.com"}) is result
+
+    static = Environment({"DEBUG": "false"})
+    assert static.substitute({"domain": "example.com"}) is static
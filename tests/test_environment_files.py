@@ -0,0 +1,106 @@
+import pytest
+
+from ecs_deplojo import environment_files
+from ecs_deplojo.environment import Environment
+from ecs_deplojo.task_definitions import TaskDefinition
+
+
+def make_task_definition(name, environment, **container):
+    return TaskDefinition(
+        {
+            "family": name,
+            "containerDefinitions": [
+                dict(name="web", image="web:1.0", environment=environment, **container),
+                dict(
+                    name="worker", image="web:1.0", environment=environment, **container
+                ),
+            ],
+        }
+    )
+
+
+def test_offload_environments(cluster, connection):
+    connection.s3.create_bucket(
+        Bucket="deplojo-config",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+    )
+    environment = Environment(
+        {"DEBUG": "false", "KEY": "-----BEGIN KEY-----\n-----END KEY-----"}
+    )
+    task_definitions = {
+        "web": make_task_definition("web", environment),
+        "worker": make_task_definition("worker", environment),
+    }
+
+    environment_files.offload_environments(
+        connection, task_definitions, bucket="deplojo-config", prefix="env/"
+    )
+
+    objects = connection.s3.list_objects_v2(Bucket="deplojo-config")["Contents"]
+    assert len(objects) == 1
+    key = objects[0]["Key"]
+    assert key.startswith("env/") and key.endswith(".env")
+    body = connection.s3.get_object(Bucket="deplojo-config", Key=key)["Body"].read()
+    assert body == b"DEBUG=false\n"
+
+    for task_definition in task_definitions.values():
+        for container in task_definition.as_dict()["containerDefinitions"]:
+            assert container["environment"] == [
+                {"name": "KEY", "value": "-----BEGIN KEY-----\n-----END KEY-----"}
+            ]
+            assert container["environmentFiles"] == [
+                {"value": "arn:aws:s3:::deplojo-config/%s" % key, "type": "s3"}
+            ]
+
+
+def test_offload_environments_existing_object(cluster, connection, monkeypatch):
+    connection.s3.create_bucket(
+        Bucket="deplojo-config",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+    )
+    task_definitions = {"web": make_task_definition("web", Environment({"A": "1"}))}
+    environment_files.offload_environments(
+        connection, task_definitions, "deplojo-config"
+    )
+
+    # The object already exists, so it is not uploaded again
+    put_object = connection.s3.put_object
+    monkeypatch.setattr(
+        connection.s3, "put_object", lambda **kwargs: pytest.fail("uploaded")
+    )
+    task_definitions = {"web": make_task_definition("web", Environment({"A": "1"}))}
+    environment_files.offload_environments(
+        connection, task_definitions, "deplojo-config"
+    )
+
+    # An object removed from the bucket is uploaded again
+    monkeypatch.setattr(connection.s3, "put_object", put_object)
+    key = connection.s3.list_objects_v2(Bucket="deplojo-config")["Contents"][0]["Key"]
+    connection.s3.delete_object(Bucket="deplojo-config", Key=key)
+    task_definitions = {"web": make_task_definition("web", Environment({"A": "1"}))}
+    environment_files.offload_environments(
+        connection, task_definitions, "deplojo-config"
+    )
+    objects = connection.s3.list_objects_v2(Bucket="deplojo-config")["Contents"]
+    assert [obj["Key"] for obj in objects] == [key]
+
+
+def test_offload_environments_template_files(cluster, connection):
+    connection.s3.create_bucket(
+        Bucket="deplojo-config",
+        CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+    )
+    template_file = {"value": "arn:aws:s3:::other/defaults.env", "type": "s3"}
+    task_definition = make_task_definition(
+        "web", Environment({"A": "1"}), environmentFiles=[template_file]
+    )
+    environment_files.offload_environments(
+        connection, {"web": task_definition}, "deplojo-config"
+    )
+
+    # The generated file comes first, so the config overrides the template
+    for container in task_definition.container_definitions:
+        assert container["environmentFiles"][0]["value"].startswith(
+            "arn:aws:s3:::deplojo-config/"
+        )
+        assert container["environmentFiles"][1:] == [template_file]
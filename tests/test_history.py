@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from ecs_deplojo import cli, history
+
+
+def test_percentile():
+    assert history.percentile([3, 1, 2], 50) == 2
+    assert history.percentile([1, 2, 3, 4], 50) == 2.5
+    assert history.percentile([1, 2, 3, 4], 100) == 4
+    assert history.percentile([7], 99) == 7
+
+
+def test_format_duration():
+    assert history.format_duration(4.6) == "5s"
+    assert history.format_duration(90) == "1m30s"
+
+
+def test_estimate_and_timeout(tmpdir):
+    store = history.History(tmpdir.join("history.db").strpath)
+    assert store.estimate("default", "web") is None
+    assert store.timeout("default", "web") == history.DEFAULT_TIMEOUT
+
+    for duration in [40, 50, 60, 70, 80]:
+        run = store.start_run("default")
+        run.record_service("web", duration, "stable")
+        run.record_service("worker", 10, "stable")
+        run.finish("success")
+    run = store.start_run("default")
+    run.record_service("web", 900, "timeout")
+    run.finish("failed")
+
+    assert store.estimate("default", "web") == 60
+    assert store.timeout("default", "web") == pytest.approx(79.6 * 2)
+    assert store.timeout("default", "worker") == history.MIN_TIMEOUT
+    assert store.timeout("other", "web") == history.DEFAULT_TIMEOUT
+
+
+def test_record_run_failed(tmpdir):
+    filename = tmpdir.join("history.db").strpath
+    store = history.History(filename)
+    with pytest.raises(RuntimeError):
+        with history.record_run(store, "default") as run:
+            run.set_task_definition("web", "web", "abc")
+            run.record_service("web", 12.5, "stable")
+            raise RuntimeError()
+    store.close()
+
+    db = sqlite3.connect(filename)
+    assert db.execute("SELECT cluster, outcome FROM runs").fetchall() == [
+        ("default", "failed")
+    ]
+    assert db.execute(
+        "SELECT service, task_definition, digest, duration, outcome FROM services"
+    ).fetchall() == [("web", "web", "abc", 12.5, "stable")]
+
+
+def test_run_with_history(example_project, cluster, tmpdir, caplog):
+    filename = tmpdir.join("history", "deploys.db").strpath
+    for _ in range(2):
+        cli.run(
+            filename=example_project.strpath,
+            template_vars={"image": "my-docker-image:1.0"},
+            create_missing_services=True,
+            history_path=filename,
+        )
+
+    db = sqlite3.connect(filename)
+    assert db.execute("SELECT outcome FROM runs").fetchall() == [
+        ("success",),
+        ("success",),
+    ]
+    rows = db.execute("SELECT service, digest, outcome FROM services").fetchall()
+    assert [(service, outcome) for service, _, outcome in rows] == [
+        ("web", "stable"),
+        ("web", "stable"),
+    ]
+    assert rows[0][1] and rows[0][1] == rows[1][1]
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert any(line.startswith("Expected time until stable: web ") for line in lines)
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+
+from ecs_deplojo import images
+from ecs_deplojo.exceptions import DeploymentFailed
+from ecs_deplojo.task_definitions import TaskDefinition
+
+REGISTRY = "123456789012.dkr.ecr.eu-west-1.amazonaws.com"
+
+
+def push_image(connection, repository, tag, layer):
+    manifest = {
+        "schemaVersion": 2,
+        "mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+        "config": {
+            "digest": "sha256:" + layer * 64,
+            "size": 1,
+            "mediaType": "application/vnd.docker.container.image.v1+json",
+        },
+        "layers": [],
+    }
+    response = connection.ecr.put_image(
+        repositoryName=repository, imageManifest=json.dumps(manifest), imageTag=tag
+    )
+    return response["image"]["imageId"]["imageDigest"]
+
+
+def make_task_definition(*images):
+    return TaskDefinition(
+        {
+            "family": "web",
+            "containerDefinitions": [
+                {"name": "container-%d" % i, "image": image}
+                for i, image in enumerate(images)
+            ],
+        }
+    )
+
+
+def test_ecr_image_re():
+    match = images.ECR_IMAGE_RE.match(REGISTRY + "/team/app:1.0")
+    assert match["account"] == "123456789012"
+    assert match["region"] == "eu-west-1"
+    assert match["repository"] == "team/app"
+    assert match["tag"] == "1.0"
+
+    assert images.ECR_IMAGE_RE.match(REGISTRY + "/app")["tag"] is None
+    assert not images.ECR_IMAGE_RE.match(REGISTRY + "/app@sha256:" + "a" * 64)
+    assert not images.ECR_IMAGE_RE.match("nginx:1.25")
+    assert not images.ECR_IMAGE_RE.match("ghcr.io/org/app:1.0")
+
+
+def test_pin_image_digests(cluster, connection, monkeypatch):
+    connection.ecr.create_repository(repositoryName="team/app")
+    connection.ecr.create_repository(repositoryName="proxy")
+    app_digest = push_image(connection, "team/app", "1.0", "a")
+    proxy_digest = push_image(connection, "proxy", "latest", "b")
+
+    task_definitions = {
+        "web": make_task_definition(
+            REGISTRY + "/team/app:1.0", REGISTRY + "/proxy", "nginx:1.25"
+        ),
+        "worker": make_task_definition(REGISTRY + "/team/app:1.0"),
+    }
+
+    calls = []
+    describe_images = connection.ecr.describe_images
+    monkeypatch.setattr(
+        connection.ecr,
+        "describe_images",
+        lambda **kwargs: calls.append(kwargs) or describe_images(**kwargs),
+    )
+
+    assert images.pin_image_digests(connection, task_definitions) == 3
+
+    web = task_definitions["web"].container_definitions
+    assert web[0]["image"] == REGISTRY + "/team/app@" + app_digest
+    assert web[1]["image"] == REGISTRY + "/proxy@" + proxy_digest
+    assert web[2]["image"] == "nginx:1.25"
+    worker = task_definitions["worker"].container_definitions
+    assert worker[0]["image"] == REGISTRY + "/team/app@" + app_digest
+
+    # One call per repository
+    assert sorted(call["repositoryName"] for call in calls) == ["proxy", "team/app"]
+
+
+def test_resolve_digests_batches(cluster, connection, monkeypatch):
+    connection.ecr.create_repository(repositoryName="app")
+    for i in range(3):
+        push_image(connection, "app", "v%d" % i, "abc"[i])
+
+    calls = []
+    describe_images = connection.ecr.describe_images
+    monkeypatch.setattr(
+        connection.ecr,
+        "describe_images",
+        lambda **kwargs: calls.append(kwargs) or describe_images(**kwargs),
+    )
+    monkeypatch.setattr(images, "BATCH_SIZE", 2)
+
+    digests = images.resolve_digests(
+        connection, ("123456789012", "eu-west-1", "app"), ["v0", "v1", "v2", "v1"]
+    )
+    assert sorted(digests) == ["v0", "v1", "v2"]
+    assert [len(call["imageIds"]) for call in calls] == [2, 1]
+
+
+def test_pin_image_digests_missing_tag(cluster, connection):
+    connection.ecr.create_repository(repositoryName="app")
+    push_image(connection, "app", "1.0", "a")
+    task_definitions = {"web": make_task_definition(REGISTRY + "/app:2.0")}
+
+    with pytest.raises(DeploymentFailed):
+        images.pin_image_digests(connection, task_definitions)
+
+
+def test_pin_image_digests_without_ecr_images(connection):
+    task_definitions = {"web": make_task_definition("nginx:1.25")}
+    assert images.pin_image_digests(connection, task_definitions) == 0
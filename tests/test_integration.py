@@ -2,6 +2,7 @@ import pytest
 from click.testing import CliRunner
 
 from ecs_deplojo import cli
+from ecs_deplojo import connection as connection_module
 
 
 def test_cli_execution_existing_service(
@@ -99,3 +100,90 @@ def test_run_update_service(example_project, cluster, connection, definition, ca
     ]
     lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
     assert lines == expected
+
+
+def test_run_batch(example_project, cluster, tmpdir, monkeypatch, caplog):
+    monkeypatch.setattr(connection_module, "_connections", {})
+    missing = tmpdir.join("missing.yml").strpath
+
+    results = cli.run_batch(
+        filenames=[example_project.strpath, missing],
+        template_vars={"image": "my-docker-image:1.0"},
+        create_missing_services=True,
+        concurrency=2,
+    )
+
+    assert [r.filename for r in results] == [example_project.strpath, missing]
+    assert results[0].error is None
+    assert "No such file" in results[1].error
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert "Deployed 2 configs: 1 succeeded, 1 failed" in lines
+    assert "Deployment finished: web (1/1)" in lines
+
+
+def test_batch_exit_code(example_project, cluster, tmpdir, monkeypatch):
+    monkeypatch.setattr(connection_module, "_connections", {})
+    runner = CliRunner()
+    result = runner.invoke(
+        cli.batch,
+        [
+            "--config",
+            example_project.strpath,
+            "--config",
+            tmpdir.join("missing.yml").strpath,
+            "--var",
+            "image=my-docker-image:1.0",
+            "--dry-run",
+        ],
+    )
+    assert result.exit_code == 1
+
+
+def test_run_capacity_aware_rollout(example_project, cluster, caplog):
+    example_project.write("capacity_aware_rollout: true\n", mode="a")
+    cli.run(
+        filename=example_project.strpath,
+        template_vars={"image": "my-docker-image:1.0"},
+        create_missing_services=True,
+    )
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert "Creating new service web with task definition web:1" in lines
+    assert "Deployment finished: web (1/1)" in lines
+
+
+def test_run_skip_unchanged_services(example_project, cluster, caplog):
+    example_project.write("skip_unchanged_services: true\n", mode="a")
+    for _ in range(2):
+        cli.run(
+            filename=example_project.strpath,
+            template_vars={"image": "my-docker-image:1.0"},
+            create_missing_services=True,
+        )
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert lines[lines.index("Deregistering old task definitions") + 2 :] == [
+        "Starting deploy on cluster default (1 services)",
+        "Task definition web:1 is unchanged",
+        "Starting one-off task 'manage.py migrate --noinput' via web:1 (web-1)",
+        "Service web already runs web:1, skipping",
+        "Starting one-off task 'manage.py clearsessions' via web:1 (web-1)",
+        "Deregistering old task definitions",
+        " - web",
+    ]
+
+
+def test_run_skip_unchanged_services_changed(example_project, cluster, caplog):
+    example_project.write("skip_unchanged_services: true\n", mode="a")
+    for image in ["my-docker-image:1.0", "my-docker-image:2.0"]:
+        cli.run(
+            filename=example_project.strpath,
+            template_vars={"image": image},
+            create_missing_services=True,
+        )
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert "Registered new task definition web:2" in lines
+    assert "Updating service web with task definition web:2" in lines
+    assert "Deployment finished: web (1/1)" in lines[-4:]
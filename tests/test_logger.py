@@ -0,0 +1,72 @@
+import io
+import json
+import logging
+
+import pytest
+
+from ecs_deplojo import logger as logger_module
+from ecs_deplojo.logger import JSONFormatter, configure_logging, logger
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    previous = logger_module.handler.setStream(stream)
+    yield stream
+    configure_logging("text")
+    logger_module.handler.setStream(previous)
+
+
+def read_lines(stream):
+    logger_module.log_queue.join()
+    return stream.getvalue().splitlines()
+
+
+def test_text_format(output):
+    logger.info("Updating service %s", "web", extra={"service": "web"})
+    lines = read_lines(output)
+    assert len(lines) == 1
+    assert lines[0].endswith("] Updating service web")
+
+
+def test_json_format(output):
+    configure_logging("json")
+    logger.info(
+        "Deployment finished: %s",
+        "web (1/1)",
+        extra={"phase": "wait", "service": "web", "duration": 12.5},
+    )
+    data = json.loads(read_lines(output)[0])
+    assert data["message"] == "Deployment finished: web (1/1)"
+    assert data["level"] == "info"
+    assert data["phase"] == "wait"
+    assert data["service"] == "web"
+    assert data["duration"] == 12.5
+    assert "event_id" not in data
+    assert data["time"].endswith("+00:00")
+
+
+def test_json_format_exception(output):
+    configure_logging("json")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Error, exiting")
+
+    lines = read_lines(output)
+    assert len(lines) == 1
+    data = json.loads(lines[0])
+    assert data["message"] == "Error, exiting"
+    assert "ValueError: boom" in data["exception"]
+
+
+def test_json_formatter_record():
+    record = logging.LogRecord("deploy", logging.ERROR, "", 0, "%s", ("x",), None)
+    record.event_id = "abc"
+    data = json.loads(JSONFormatter().format(record))
+    assert data == {
+        "time": data["time"],
+        "level": "error",
+        "message": "x",
+        "event_id": "abc",
+    }
@@ -0,0 +1,112 @@
+from ecs_deplojo import merge
+from ecs_deplojo.environment import Environment
+from ecs_deplojo.task_definitions import TaskDefinition
+
+
+def test_merge_overrides():
+    environment = Environment({"DEBUG": "false"})
+    secrets = {"DATABASE_URL": "/database-url"}
+    containers = [
+        {
+            "name": "web",
+            "command": ["uwsgi", "--http=:8080"],
+            "memory": 256,
+            "portMappings": [
+                {"containerPort": 8080, "hostPort": 0},
+                {"containerPort": 8080, "hostPort": 0, "protocol": "udp"},
+            ],
+            "mountPoints": [{"containerPath": "/data", "sourceVolume": "data"}],
+            "dnsServers": ["10.0.0.1"],
+            "logConfiguration": {
+                "logDriver": "awslogs",
+                "options": {"awslogs-group": "default"},
+            },
+            "environment": environment,
+            "secrets": secrets,
+        },
+        {"name": "worker", "memory": 256, "environment": environment},
+    ]
+    overrides = {
+        "web": {
+            "command": ["uwsgi", "--http=:9000"],
+            "memory": 512,
+            "portMappings": [
+                {"containerPort": 8080, "hostPort": 80, "protocol": "tcp"},
+                {"containerPort": 9000, "hostPort": 0},
+            ],
+            "mountPoints": [{"containerPath": "/data", "sourceVolume": "other"}],
+            "dnsServers": ["10.0.0.1", "10.0.0.2"],
+            "logConfiguration": {"options": {"awslogs-region": "eu-west-1"}},
+            "environment": {"DEBUG": "true"},
+            "secrets": {"API_KEY": "/api-key"},
+        }
+    }
+
+    plan = merge.compile_overrides(overrides)
+    merge.apply_plan(containers, plan)
+
+    web, worker = containers
+    assert web["command"] == ["uwsgi", "--http=:9000"]
+    assert web["memory"] == 512
+    assert web["portMappings"] == [
+        {"containerPort": 8080, "hostPort": 80, "protocol": "tcp"},
+        {"containerPort": 8080, "hostPort": 0, "protocol": "udp"},
+        {"containerPort": 9000, "hostPort": 0},
+    ]
+    assert web["mountPoints"] == [{"containerPath": "/data", "sourceVolume": "other"}]
+    assert web["dnsServers"] == ["10.0.0.1", "10.0.0.2"]
+    assert web["logConfiguration"] == {
+        "logDriver": "awslogs",
+        "options": {"awslogs-group": "default", "awslogs-region": "eu-west-1"},
+    }
+    assert web["environment"] == {"DEBUG": "true"}
+    assert web["secrets"] == {"DATABASE_URL": "/database-url", "API_KEY": "/api-key"}
+
+    # The shared values are not modified
+    assert worker == {"name": "worker", "memory": 256, "environment": environment}
+    assert environment == {"DEBUG": "false"}
+    assert secrets == {"DATABASE_URL": "/database-url"}
+
+    # Neither are the overrides
+    web["portMappings"][2]["hostPort"] = 10
+    assert overrides["web"]["portMappings"][1] == {"containerPort": 9000, "hostPort": 0}
+
+
+def test_merge_nested_lists():
+    task_definition = TaskDefinition(
+        {
+            "containerDefinitions": [
+                {
+                    "name": "web",
+                    "healthCheck": {"command": ["CMD-SHELL", "exit 0"], "retries": 3},
+                    "linuxParameters": {
+                        "capabilities": {"add": ["SYS_PTRACE"]},
+                        "tmpfs": [{"containerPath": "/tmp", "size": 64}],
+                    },
+                }
+            ]
+        }
+    )
+    task_definition.apply_overrides(
+        {
+            "web": {
+                "healthCheck": {
+                    "command": ["CMD-SHELL", "curl -f localhost || exit 1"]
+                },
+                "linuxParameters": {
+                    "capabilities": {"add": ["NET_ADMIN"]},
+                    "tmpfs": [{"containerPath": "/tmp", "size": 128}],
+                },
+            }
+        }
+    )
+
+    container = task_definition.container_definitions[0]
+    assert container["healthCheck"] == {
+        "command": ["CMD-SHELL", "curl -f localhost || exit 1"],
+        "retries": 3,
+    }
+    assert container["linuxParameters"] == {
+        "capabilities": {"add": ["SYS_PTRACE", "NET_ADMIN"]},
+        "tmpfs": [{"containerPath": "/tmp", "size": 128}],
+    }
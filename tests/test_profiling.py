@@ -0,0 +1,41 @@
+import pstats
+import time
+
+from ecs_deplojo import profiling
+
+
+def busy(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def test_profile(tmpdir, caplog):
+    prefix = tmpdir.join("deploy").strpath
+    with profiling.profile(prefix, interval=0.001):
+        busy(0.05)
+        time.sleep(0.05)
+
+    stats = pstats.Stats(prefix + ".pstats")
+    assert any(func[2] == "busy" for func in stats.stats)
+
+    with open(prefix + ".collapsed") as fh:
+        lines = fh.read().splitlines()
+    stacks = [line.rsplit(" ", 1)[0] for line in lines]
+    assert any(s.startswith("cpu;") and "busy (" in s for s in stacks)
+    assert any(s.startswith("wait;") and "test_profile (" in s for s in stacks)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+
+    message = [r.message for r in caplog.records if r.name == "deploy"][-1]
+    assert message.startswith("Profile: ")
+
+
+def test_profile_exception(tmpdir):
+    prefix = tmpdir.join("deploy").strpath
+    try:
+        with profiling.profile(prefix):
+            raise SystemExit(1)
+    except SystemExit:
+        pass
+    assert tmpdir.join("deploy.pstats").exists()
+    assert tmpdir.join("deploy.collapsed").exists()
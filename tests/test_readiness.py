@@ -0,0 +1,143 @@
+import boto3
+import pytest
+
+from ecs_deplojo.readiness import TargetHealth, task_targets
+
+TASK_DEFINITION_ARN = "arn:aws:ecs:eu-west-1:123456789012:task-definition/web:2"
+LOAD_BALANCER = {"containerName": "web", "containerPort": 8080}
+
+
+@pytest.fixture
+def target_group(cluster):
+    ec2 = boto3.client("ec2", region_name="eu-west-1")
+    elbv2 = boto3.client("elbv2", region_name="eu-west-1")
+    vpc_id = ec2.describe_vpcs()["Vpcs"][0]["VpcId"]
+    response = elbv2.create_target_group(
+        Name="web", Protocol="HTTP", Port=80, VpcId=vpc_id, TargetType="instance"
+    )
+    return response["TargetGroups"][0]["TargetGroupArn"]
+
+
+@pytest.fixture
+def container_instance(cluster):
+    ecs = boto3.client("ecs", region_name="eu-west-1")
+    arn = ecs.list_container_instances(cluster="default")["containerInstanceArns"][0]
+    response = ecs.describe_container_instances(
+        cluster="default", containerInstances=[arn]
+    )
+    return response["containerInstances"][0]
+
+
+def make_service(target_group, running=1, desired=1, num_deployments=2):
+    deployments = [
+        {
+            "status": "PRIMARY",
+            "taskDefinition": TASK_DEFINITION_ARN,
+            "desiredCount": desired,
+            "runningCount": running,
+            "pendingCount": 0,
+        }
+    ] + [
+        {
+            "status": "ACTIVE",
+            "taskDefinition": TASK_DEFINITION_ARN.replace(":2", ":1"),
+            "desiredCount": 0,
+            "runningCount": 1,
+            "pendingCount": 0,
+        }
+    ] * (num_deployments - 1)
+    return {
+        "serviceName": "web",
+        "deployments": deployments,
+        "loadBalancers": [dict(LOAD_BALANCER, targetGroupArn=target_group)],
+    }
+
+
+def make_task(container_instance, host_port, task_definition=TASK_DEFINITION_ARN):
+    return {
+        "group": "service:web",
+        "lastStatus": "RUNNING",
+        "taskDefinitionArn": task_definition,
+        "containerInstanceArn": container_instance["containerInstanceArn"],
+        "containers": [
+            {
+                "name": "web",
+                "networkBindings": [{"containerPort": 8080, "hostPort": host_port}],
+            }
+        ],
+    }
+
+
+def test_task_targets_bridge():
+    task = {
+        "containers": [
+            {
+                "name": "web",
+                "networkBindings": [
+                    {"containerPort": 8080, "hostPort": 32768},
+                    {"containerPort": 9000, "hostPort": 32769},
+                ],
+            },
+            {
+                "name": "sidecar",
+                "networkBindings": [{"containerPort": 8080, "hostPort": 32770}],
+            },
+        ]
+    }
+    assert task_targets(task, LOAD_BALANCER, "i-123") == {("i-123", 32768)}
+
+
+def test_task_targets_awsvpc():
+    task = {
+        "containers": [
+            {"name": "web", "networkInterfaces": [{"privateIpv4Address": "10.0.0.5"}]}
+        ]
+    }
+    assert task_targets(task, LOAD_BALANCER) == {("10.0.0.5", 8080)}
+
+
+def test_ready_when_new_targets_healthy(
+    connection, target_group, container_instance, monkeypatch
+):
+    instance_id = container_instance["ec2InstanceId"]
+    connection.elbv2.register_targets(
+        TargetGroupArn=target_group, Targets=[{"Id": instance_id, "Port": 32768}]
+    )
+    checker = TargetHealth(connection, "default")
+    tasks = [
+        make_task(container_instance, 32768),
+        make_task(container_instance, 32000, TASK_DEFINITION_ARN.replace(":2", ":1")),
+    ]
+    monkeypatch.setattr(checker, "_running_tasks", lambda services: {"web": tasks})
+
+    # The old deployment is still running, but the new task is healthy
+    assert checker.ready_services([make_service(target_group)]) == {"web"}
+
+
+def test_not_ready_when_target_missing(
+    connection, target_group, container_instance, monkeypatch
+):
+    checker = TargetHealth(connection, "default")
+    tasks = [make_task(container_instance, 32768)]
+    monkeypatch.setattr(checker, "_running_tasks", lambda services: {"web": tasks})
+    assert checker.ready_services([make_service(target_group)]) == set()
+
+
+def test_not_ready_when_tasks_pending(connection, target_group, monkeypatch):
+    checker = TargetHealth(connection, "default")
+    monkeypatch.setattr(checker, "_running_tasks", pytest.fail)
+    service = make_service(target_group, running=0)
+    assert checker.ready_services([service]) == set()
+
+
+def test_ready_without_load_balancers(connection):
+    checker = TargetHealth(connection, "default")
+    service = {"serviceName": "worker", "deployments": [{"status": "PRIMARY"}]}
+    assert checker.ready_services([service]) == {"worker"}
+    service["deployments"].append({"status": "ACTIVE"})
+    assert checker.ready_services([service]) == set()
+
+
+def test_running_tasks_without_tasks(connection):
+    checker = TargetHealth(connection, "default")
+    assert checker._running_tasks([{"serviceName": "web"}]) == {}
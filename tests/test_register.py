@@ -92,3 +92,72 @@ def test_deregister_task_definitions(cluster, connection):
     # deregistration of task definitions doesn't appear to work
     #assert len(result["taskDefinitionArns"]) == 1
     assert len(result["taskDefinitionArns"]) > 0
+
+
+def make_target(target_id, family, revision, cluster="default"):
+    return {
+        "Id": target_id,
+        "Arn": "arn:aws:ecs:eu-west-1:123456789012:cluster/%s" % cluster,
+        "RoleArn": "arn:aws:iam::123456789012:role/events",
+        "EcsParameters": {
+            "TaskDefinitionArn": (
+                "arn:aws:ecs:eu-west-1:123456789012:task-definition/%s:%d"
+                % (family, revision)
+            ),
+            "TaskCount": 1,
+        },
+    }
+
+
+def test_update_discovered_rules(cluster, connection, monkeypatch):
+    for name in ("cron", "nightly", "configured", "other", "other-cluster"):
+        connection.events.put_rule(Name=name, ScheduleExpression="rate(1 hour)")
+    connection.events.put_targets(
+        Rule="cron",
+        Targets=[make_target("1", "my-task-def", 1), make_target("2", "other", 1)],
+    )
+    connection.events.put_targets(
+        Rule="nightly", Targets=[make_target("1", "my-task-def", 2)]
+    )
+    connection.events.put_targets(
+        Rule="configured", Targets=[make_target("1", "my-task-def", 1)]
+    )
+    connection.events.put_targets(Rule="other", Targets=[make_target("1", "other", 1)])
+    connection.events.put_targets(
+        Rule="other-cluster",
+        Targets=[make_target("1", "my-task-def", 1, cluster="staging")],
+    )
+
+    assert register.discover_rules(connection, "default") == {
+        "my-task-def": {"cron", "nightly", "configured"},
+        "other": {"cron", "other"},
+    }
+    assert register.discover_rules(connection, "missing") == {}
+
+    definition = TaskDefinition({"family": "my-task-def"})
+    definition.name = "my-task-def:3"
+    definition.arn = "arn:aws:ecs:eu-west-1:123456789012:task-definition/my-task-def:3"
+    num = register.update_discovered_rules(
+        connection, "default", {"web": definition}, exclude=["configured"]
+    )
+    assert num == 2
+
+    def task_definition_arns(rule):
+        targets = connection.events.list_targets_by_rule(Rule=rule)["Targets"]
+        return {
+            t["Id"]: t["EcsParameters"]["TaskDefinitionArn"].rsplit("/", 1)[1]
+            for t in targets
+        }
+
+    assert task_definition_arns("cron") == {"1": "my-task-def:3", "2": "other:1"}
+    assert task_definition_arns("nightly") == {"1": "my-task-def:3"}
+    assert task_definition_arns("configured") == {"1": "my-task-def:1"}
+    assert task_definition_arns("other-cluster") == {"1": "my-task-def:1"}
+
+    # The rules are found via their targets instead of listing all rules
+    monkeypatch.setattr(connection.events, "list_rules", None)
+    assert register.discover_rules(connection, "default")["my-task-def"] == {
+        "cron",
+        "nightly",
+        "configured",
+    }
@@ -0,0 +1,94 @@
+import pytest
+
+from ecs_deplojo.environment import Environment
+from ecs_deplojo.exceptions import ValidationError
+from ecs_deplojo.secret_references import check_secrets
+from ecs_deplojo.task_definitions import TaskDefinition
+
+
+def make_task_definition(secrets):
+    return TaskDefinition(
+        {
+            "family": "web",
+            "containerDefinitions": [
+                {"name": "web", "image": "web:1.0", "secrets": secrets},
+                {"name": "worker", "image": "web:1.0", "secrets": secrets},
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def secret_arn(connection):
+    connection.ssm.put_parameter(Name="/app/db", Value="x", Type="SecureString")
+    connection.ssm.put_parameter(Name="flat", Value="x", Type="String")
+    response = connection.secretsmanager.create_secret(
+        Name="app/key", SecretString='{"key": "x"}'
+    )
+    return response["ARN"]
+
+
+def test_check_secrets(connection, secret_arn, monkeypatch):
+    calls = []
+    get_parameters = connection.ssm.get_parameters
+    monkeypatch.setattr(
+        connection.ssm,
+        "get_parameters",
+        lambda **kwargs: calls.append(kwargs) or get_parameters(**kwargs),
+    )
+
+    secrets = {
+        "DB": "/app/db",
+        "FLAT": "arn:aws:ssm:eu-west-1:123456789012:parameter/flat",
+        "KEY": secret_arn + ":key::",
+    }
+    task_definitions = {
+        "web": make_task_definition(Environment(secrets)),
+        "worker": make_task_definition([{"name": "DB", "valueFrom": "/app/db"}] * 12),
+    }
+    check_secrets(connection, task_definitions)
+
+    # Every parameter is only checked once
+    assert len(calls) == 1
+    assert sorted(calls[0]["Names"]) == [
+        "/app/db",
+        "arn:aws:ssm:eu-west-1:123456789012:parameter/flat",
+    ]
+
+
+def test_check_secrets_missing(connection, secret_arn):
+    task_definitions = {
+        "web": make_task_definition(
+            {
+                "DB": "/app/typo",
+                "KEY": secret_arn[:-6] + "XXXXXX",
+                **{"VAR_%d" % i: "/app/db" for i in range(20)},
+            }
+        ),
+        "worker": make_task_definition({"DB": "/app/typo"}),
+    }
+    with pytest.raises(ValidationError) as exc_info:
+        check_secrets(connection, task_definitions)
+
+    assert exc_info.value.errors == [
+        "Secret /app/typo (used by web, worker) does not exist",
+        "Secret %s (used by web) does not exist" % (secret_arn[:-6] + "XXXXXX"),
+    ]
+
+
+def test_check_secrets_batches(connection, monkeypatch):
+    calls = []
+    get_parameters = connection.ssm.get_parameters
+    monkeypatch.setattr(
+        connection.ssm,
+        "get_parameters",
+        lambda **kwargs: calls.append(kwargs) or get_parameters(**kwargs),
+    )
+    for i in range(25):
+        connection.ssm.put_parameter(Name="/p/%d" % i, Value="x", Type="String")
+    task_definitions = {
+        "web": make_task_definition({"VAR_%d" % i: "/p/%d" % i for i in range(25)})
+    }
+
+    check_secrets(connection, task_definitions)
+    assert sorted(len(call["Names"]) for call in calls) == [5, 10, 10]
@@ -0,0 +1,139 @@
+import http.client
+import json
+import os
+import stat
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from ecs_deplojo import connection as connection_module
+from ecs_deplojo import server
+
+TOKEN = "s3cr3t"
+
+
+@pytest.fixture
+def deploy_server(cluster, monkeypatch):
+    monkeypatch.setattr(connection_module, "_connections", {})
+    instance = server.DeployServer(("127.0.0.1", 0), server.DeployState(token=TOKEN))
+    thread = threading.Thread(target=instance.serve_forever, daemon=True)
+    thread.start()
+    yield instance
+    instance.shutdown()
+    instance.server_close()
+
+
+def request(deploy_server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", deploy_server.server_address[1])
+    headers = dict(
+        {"Content-Type": "application/json", "Authorization": "Bearer %s" % TOKEN},
+        **(headers or {}),
+    )
+    conn.request(
+        method,
+        path,
+        body=json.dumps(body) if body is not None else None,
+        headers={k: v for k, v in headers.items() if v is not None},
+    )
+    response = conn.getresponse()
+    return response.status, response.read().decode("utf-8")
+
+
+def test_health(deploy_server):
+    status, body = request(deploy_server, "GET", "/health")
+    assert status == 200
+    assert json.loads(body) == {"status": "ok"}
+
+
+def test_deploy_streams_events(deploy_server, example_project):
+    status, body = request(
+        deploy_server,
+        "POST",
+        "/deploy",
+        {
+            "config": example_project.strpath,
+            "vars": {"image": "my-docker-image:1.0"},
+            "create_missing_services": True,
+        },
+    )
+    assert status == 200
+
+    events = [json.loads(line) for line in body.splitlines()]
+    messages = [e["message"] for e in events if e["event"] == "log"]
+    assert messages[0] == "Starting deploy on cluster default (1 services)"
+    assert "Deployment finished: web (1/1)" in messages
+    assert events[-1]["event"] == "finished"
+    assert list(events[-1]["task_definitions"]) == ["web"]
+
+    # Templates stay cached between deployments
+    assert len(deploy_server.state.template_cache._entries) == 1
+
+
+def test_deploy_invalid_config(deploy_server, tmpdir):
+    filename = tmpdir.join("config.yml")
+    filename.write("cluster_name: default\n")
+    status, body = request(
+        deploy_server, "POST", "/deploy", {"config": filename.strpath}
+    )
+    assert status == 200
+    result = json.loads(body.splitlines()[-1])
+    assert result["event"] == "failed"
+    assert "config: missing required key 'task_definitions'" in result["errors"]
+
+
+def test_deploy_bad_request(deploy_server):
+    status, body = request(deploy_server, "POST", "/deploy", {"vars": {}})
+    assert status == 400
+
+
+def test_cluster_semaphore():
+    state = server.DeployState(max_concurrent_deploys=2)
+    semaphore = state.cluster_semaphore("default")
+    assert state.cluster_semaphore("default") is semaphore
+    assert state.cluster_semaphore("other") is not semaphore
+    assert semaphore.acquire(blocking=False)
+    assert semaphore.acquire(blocking=False)
+    assert not semaphore.acquire(blocking=False)
+
+
+@pytest.mark.parametrize(
+    "headers,body,status",
+    [
+        ({"Authorization": None}, {}, 401),
+        ({"Authorization": "Bearer wrong"}, {}, 401),
+        ({"Content-Type": "text/plain"}, {}, 415),
+        ({"Origin": "https://example.com"}, {}, 403),
+        ({}, {"role_arn": "arn:aws:iam::123456789012:role/admin"}, 403),
+    ],
+)
+def test_deploy_rejected(deploy_server, example_project, headers, body, status):
+    body = dict(body, config=example_project.strpath)
+    assert request(deploy_server, "POST", "/deploy", body, headers)[0] == status
+
+
+def test_role_arn():
+    state = server.DeployState(role_arn="default")
+    assert state.request_role_arn({"role_arn": "other"}) == "default"
+    assert state.is_authorized(None)
+
+    state = server.DeployState(role_arn="default", allow_role_arn=True, token="t")
+    assert state.request_role_arn({"role_arn": "other"}) == "other"
+    assert state.request_role_arn({}) == "default"
+    assert state.is_authorized("Bearer t")
+    assert not state.is_authorized("Bearer ")
+
+
+def test_main_requires_token():
+    result = CliRunner().invoke(server.main, ["--port", "0"])
+    assert result.exit_code == 2
+    assert "--token" in result.output
+
+
+def test_unix_socket_permissions(tmpdir):
+    path = tmpdir.join("deplojo.sock").strpath
+    instance = server.UnixDeployServer(path, server.DeployState())
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    finally:
+        instance.server_close()
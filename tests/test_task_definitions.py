@@ -1,6 +1,10 @@
+import json
 import os
 
+import pytest
+
 from ecs_deplojo import task_definitions
+from ecs_deplojo.exceptions import ValidationError
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -578,3 +582,422 @@ def test_generate_task_definition_awsvpc(tmpdir):
         }
     )
     assert task_definition == expected
+
+
+def test_template_cache(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write('{"family": "default", "containerDefinitions": []}')
+
+    cache = task_definitions.TemplateCache()
+    first = cache.load(filename.strpath)
+    first.family = "changed"
+
+    second = cache.load(filename.strpath)
+    assert second.family == "default"
+    assert first._data is not second._data
+
+    # Changing the file invalidates the cached entry
+    filename.write('{"family": "updated", "containerDefinitions": []}')
+    os.utime(filename.strpath, ns=(0, 0))
+    assert cache.load(filename.strpath).family == "updated"
+
+
+def test_generate_task_definitions_shared_environment(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        '{"family": "default", "containerDefinitions": ['
+        '{"name": "web-1", "image": "${image}"},'
+        '{"name": "web-2", "image": "${image}"}]}'
+    )
+
+    config = {
+        "environment": {"DATABASE_URL": "postgresql://"},
+        "environment_groups": {"group-1": {"ENV_CODE": "group-1"}},
+        "task_definitions": {
+            "task-def-1": {
+                "template": filename.strpath,
+                "environment_group": "group-1",
+                "overrides": {"web-1": {"environment": {"WORKER": "1"}}},
+            },
+            "task-def-2": {
+                "template": filename.strpath,
+                "environment_group": "group-1",
+            },
+        },
+    }
+    result = task_definitions.generate_task_definitions(
+        config, template_vars={"image": "my-docker-image:1.0"}, base_path=None
+    )
+
+    first = result["task-def-1"].container_definitions
+    second = result["task-def-2"].container_definitions
+    assert first[0]["environment"] == {
+        "DATABASE_URL": "postgresql://",
+        "ENV_CODE": "group-1",
+        "WORKER": "1",
+    }
+    assert first[1]["environment"] == {
+        "DATABASE_URL": "postgresql://",
+        "ENV_CODE": "group-1",
+    }
+    assert first[1]["environment"] is second[0]["environment"]
+    assert config["environment"] == {"DATABASE_URL": "postgresql://"}
+
+
+def test_generate_task_definitions_empty_sections(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        '{"family": "default", "containerDefinitions": ['
+        '{"name": "web", "image": "${image}"}]}'
+    )
+
+    # Empty sections in the YAML config are loaded as None
+    config = {
+        "environment": {"DATABASE_URL": "postgresql://"},
+        "environment_groups": None,
+        "secrets": None,
+        "task_definitions": {"task-def-1": {"template": filename.strpath}},
+    }
+    result = task_definitions.generate_task_definitions(
+        config, template_vars={"image": "my-docker-image:1.0"}, base_path=None
+    )
+
+    container = result["task-def-1"].container_definitions[0]
+    assert container["environment"] == {"DATABASE_URL": "postgresql://"}
+    assert "secrets" not in container
+
+
+@pytest.mark.parametrize("worker_type", ["thread", "process"])
+def test_generate_task_definitions_parallel(tmpdir, worker_type):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        '{"family": "default", "containerDefinitions": ['
+        '{"name": "web-1", "image": "${image}"}]}'
+    )
+    config = {
+        "task_definitions": {
+            "task-def-%d" % i: {"template": filename.strpath} for i in range(20)
+        }
+    }
+
+    result = task_definitions.generate_task_definitions(
+        config,
+        template_vars={"image": "my-docker-image:1.0"},
+        base_path=None,
+        workers=4,
+        worker_type=worker_type,
+    )
+    assert list(result) == list(config["task_definitions"])
+    assert result == task_definitions.generate_task_definitions(
+        config, template_vars={"image": "my-docker-image:1.0"}, base_path=None
+    )
+
+
+def test_generate_task_definitions_parallel_error(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        '{"family": "default", "containerDefinitions": ['
+        '{"name": "web-1", "image": "${image}"}]}'
+    )
+    config = {
+        "task_definitions": {
+            "task-def-1": {"template": filename.strpath},
+            "task-def-2": {"template": "missing-1.json"},
+            "task-def-3": {"template": "missing-2.json"},
+        }
+    }
+
+    with pytest.raises(FileNotFoundError, match="missing-1.json"):
+        task_definitions.generate_task_definitions(
+            config,
+            template_vars={"image": "my-docker-image:1.0"},
+            base_path=None,
+            workers=3,
+        )
+
+
+def test_task_definition_digest(definition):
+    digest = definition.digest()
+    assert digest == definition.digest()
+
+    # Registration details and tags are not part of the digest
+    definition.name = "default:1"
+    definition.arn = "arn:aws:ecs:eu-west-1:123456789012:task-definition/default:1"
+    definition.tags = [{"key": "createdBy", "value": "ecs-deplojo"}]
+    assert definition.digest() == digest
+
+    definition.container_definitions[0]["image"] = "my-docker-image:2.0"
+    assert definition.digest() != digest
+
+
+def test_task_definition_digest_matches_registered(cluster, connection, definition):
+    definition.container_definitions[0]["environment"] = {"B": "2", "A": "1"}
+    result = connection.ecs.register_task_definition(**definition.as_dict())
+
+    registered = connection.ecs.describe_task_definition(
+        taskDefinition=result["taskDefinition"]["taskDefinitionArn"]
+    )
+    assert (
+        task_definitions.payload_digest(registered["taskDefinition"])
+        == definition.digest()
+    )
+
+
+def test_task_definition_digest_matches_described_fargate():
+    definition = task_definitions.TaskDefinition(
+        {
+            "family": "web",
+            "networkMode": "awsvpc",
+            "requiresCompatibilities": ["FARGATE"],
+            "cpu": 256,
+            "memory": 512,
+            "containerDefinitions": [
+                {
+                    "name": "web",
+                    "image": "my-docker-image:1.0",
+                    "portMappings": [{"containerPort": 8080}],
+                    "environment": {"A": "1"},
+                }
+            ],
+        }
+    )
+    # The shape of the taskDefinition returned by ECS for the definition above
+    described = {
+        "taskDefinitionArn": (
+            "arn:aws:ecs:eu-west-1:123456789012:task-definition/web:4"
+        ),
+        "containerDefinitions": [
+            {
+                "name": "web",
+                "image": "my-docker-image:1.0",
+                "cpu": 0,
+                "portMappings": [
+                    {"containerPort": 8080, "hostPort": 8080, "protocol": "tcp"}
+                ],
+                "essential": True,
+                "environment": [{"name": "A", "value": "1"}],
+                "mountPoints": [],
+                "volumesFrom": [],
+                "systemControls": [],
+            }
+        ],
+        "family": "web",
+        "networkMode": "awsvpc",
+        "revision": 4,
+        "volumes": [],
+        "status": "ACTIVE",
+        "requiresAttributes": [
+            {"name": "com.amazonaws.ecs.capability.docker-remote-api.1.18"},
+            {"name": "ecs.capability.task-eni"},
+        ],
+        "placementConstraints": [],
+        "compatibilities": ["EC2", "FARGATE"],
+        "requiresCompatibilities": ["FARGATE"],
+        "cpu": "256",
+        "memory": "512",
+        "registeredAt": "2024-01-01T00:00:00+00:00",
+        "registeredBy": "arn:aws:iam::123456789012:role/deploy",
+    }
+    assert task_definitions.payload_digest(described) == definition.digest()
+
+    # In bridge mode the hostPort is significant (0 is a dynamic port)
+    described["networkMode"] = definition.network_mode = "bridge"
+    assert task_definitions.payload_digest(described) != definition.digest()
+
+
+def test_write_task_definitions_incremental(tmpdir, definition):
+    output_path = tmpdir.mkdir("output")
+    definitions = {"task-def-1": definition}
+    write = task_definitions.write_task_definitions
+
+    assert write(definitions, output_path.strpath) == 1
+    filename = output_path.join("task-def-1.json")
+    os.utime(filename.strpath, ns=(0, 0))
+
+    # Unchanged content is not written again
+    assert write(definitions, output_path.strpath) == 0
+    assert filename.stat().mtime == 0
+
+    definition.container_definitions[0]["image"] = "my-docker-image:2.0"
+    assert write(definitions, output_path.strpath) == 1
+    assert json.loads(filename.read())["containerDefinitions"][0]["image"] == (
+        "my-docker-image:2.0"
+    )
+    assert output_path.listdir() == [filename]
+
+
+def test_write_manifest(tmpdir, definition):
+    filename = tmpdir.join("manifest.json")
+    task_definitions.write_manifest({"task-def-1": definition}, filename.strpath)
+
+    assert json.loads(filename.read()) == {
+        "task-def-1": {"file": "task-def-1.json", "digest": definition.digest()}
+    }
+
+
+def test_generate_task_definitions_interpolate_document(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        json.dumps(
+            {
+                "family": "default",
+                "containerDefinitions": [
+                    {
+                        "name": "web-1",
+                        "image": "${image}",
+                        "command": ["run", "--env=${env}", "$$HOME"],
+                        "dockerLabels": {"version": "${version}"},
+                    }
+                ],
+            }
+        )
+    )
+    config = {
+        "interpolation": "document",
+        "environment": {"ENVIRONMENT": "${env}", "STATIC": "value"},
+        "task_definitions": {
+            "task-def-1": {
+                "template": filename.strpath,
+                "overrides": {"web-1": {"environment": {"VERSION": "${version}"}}},
+            },
+        },
+    }
+
+    result = task_definitions.generate_task_definitions(
+        config,
+        template_vars={"image": "my-docker-image:1.0", "env": "prd", "version": "1"},
+        base_path=None,
+    )
+    container = result["task-def-1"].container_definitions[0]
+    assert container["image"] == "my-docker-image:1.0"
+    assert container["command"] == ["run", "--env=prd", "$HOME"]
+    assert container["dockerLabels"] == {"version": "1"}
+    assert container["environment"] == {
+        "ENVIRONMENT": "prd",
+        "STATIC": "value",
+        "VERSION": "1",
+    }
+
+
+def test_generate_task_definitions_interpolate_errors(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        json.dumps(
+            {
+                "family": "default",
+                "containerDefinitions": [
+                    {"name": "web-1", "image": "${image}", "command": ["${cmd}"]}
+                ],
+            }
+        )
+    )
+    config = {
+        "interpolation": "document",
+        "environment": {"PASSWORD": "abc$1x"},
+        "task_definitions": {"task-def-1": {"template": filename.strpath}},
+    }
+
+    with pytest.raises(ValidationError) as exc:
+        task_definitions.generate_task_definitions(
+            config, template_vars={"image": "app:1.0", "cmd": "run"}, base_path=None
+        )
+    assert exc.value.errors == [
+        "Task definition task-def-1, container web-1, environment PASSWORD: "
+        "invalid placeholder in string: line 1, col 4, use $$ for a literal $"
+    ]
+
+    config["environment"] = {}
+    with pytest.raises(ValidationError) as exc:
+        task_definitions.generate_task_definitions(
+            config, template_vars={"image": "app:1.0"}, base_path=None
+        )
+    assert exc.value.errors == [
+        "Task definition task-def-1, containerDefinitions.0.command.0: "
+        "unknown variable $cmd"
+    ]
+
+
+def test_generate_task_definitions_interpolate_overrides(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        json.dumps(
+            {
+                "family": "default",
+                "containerDefinitions": [
+                    {"name": "web-1", "image": "${image}", "command": ["${cmd}"]}
+                ],
+            }
+        )
+    )
+    config = {
+        "interpolation": "document",
+        "task_definitions": {
+            "task-def-1": {
+                "template": filename.strpath,
+                "overrides": {"web-1": {"command": ["other", "$$HOME"]}},
+            }
+        },
+    }
+    template_vars = {"image": "app:1.0", "cmd": "run"}
+
+    # The template is interpolated, the overrides are used as is
+    result = task_definitions.generate_task_definitions(
+        config, template_vars=template_vars, base_path=None
+    )
+    container = result["task-def-1"].container_definitions[0]
+    assert container["image"] == "app:1.0"
+    assert container["command"] == ["other", "$$HOME"]
+
+    config["task_definitions"]["task-def-1"]["overrides"] = {
+        "web-1": {"image": "repo:${image}", "command": ["other", "${cmd}"]}
+    }
+    with pytest.raises(ValidationError) as exc:
+        task_definitions.generate_task_definitions(
+            config, template_vars=template_vars, base_path=None
+        )
+    assert exc.value.errors == [
+        "Task definition task-def-1, overrides.web-1.image: "
+        "placeholders are not interpolated in overrides",
+        "Task definition task-def-1, overrides.web-1.command.1: "
+        "placeholders are not interpolated in overrides",
+    ]
+
+
+def test_find_placeholders():
+    placeholders = task_definitions.find_placeholders(
+        {"a": ["static", "${var}"], "b": {"c": "$other"}, "d": 1}
+    )
+    assert [path for path, template in placeholders] == [("a", 1), ("b", "c")]
+
+
+def test_as_dict_shares_environment_lists(tmpdir):
+    filename = tmpdir.join("task_definition.json")
+    filename.write(
+        '{"family": "default", "containerDefinitions": ['
+        '{"name": "web-1", "image": "${image}"},'
+        '{"name": "web-2", "image": "${image}"}]}'
+    )
+    definition = task_definitions.generate_task_definition(
+        filename.strpath,
+        environment={"DEBUG": True, "AWS_REGION": "eu-west-1"},
+        template_vars={"image": "my-docker-image:1.0"},
+        overrides={},
+        name="my-task-def",
+        secrets={"DATABASE_URL": "/database-url"},
+    )
+
+    first, second = definition.as_dict()["containerDefinitions"]
+    assert first["environment"] == [
+        {"name": "AWS_REGION", "value": "eu-west-1"},
+        {"name": "DEBUG", "value": "True"},
+    ]
+    assert first["secrets"] == [{"name": "DATABASE_URL", "valueFrom": "/database-url"}]
+    assert first["environment"] is second["environment"]
+    assert first["secrets"] is second["secrets"]
+
+    # Plain dicts are shared within a single call
+    env = {"DEBUG": "false"}
+    for container in definition.container_definitions:
+        container["environment"] = env
+    first, second = definition.as_dict()["containerDefinitions"]
+    assert first["environment"] is second["environment"]
@@ -1,3 +1,6 @@
+import os
+import stat
+
 from ecs_deplojo import utils
 
 
@@ -51,3 +54,19 @@ def test_find_missing_services_paginate(cluster, connection, definition):
     )
     all_services.remove("service-2")
     assert missing == all_services
+
+
+def test_write_file_permissions(tmpdir):
+    filename = tmpdir.join("definition.json").strpath
+    umask = os.umask(0o022)
+    try:
+        assert utils.write_file(filename, "{}")
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o644
+
+    os.chmod(filename, 0o600)
+    assert not utils.write_file(filename, "{}")
+    assert utils.write_file(filename, "[]")
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o600
+    assert tmpdir.listdir() == [tmpdir.join("definition.json")]
@@ -0,0 +1,140 @@
+import pytest
+import yaml
+
+from ecs_deplojo import cli
+from ecs_deplojo.exceptions import ValidationError
+from ecs_deplojo.task_definitions import TaskDefinition
+from ecs_deplojo.validation import validate_config, validate_task_definitions
+
+
+def test_validate_config(example_project):
+    config = yaml.safe_load(example_project.read())
+    validate_config(config)
+
+
+def test_validate_config_errors():
+    config = {
+        "cluster_name": "default",
+        "environment": {"DEBUG": ["nested"]},
+        "task_definitions": {
+            "web": {"template": "web.json", "environment_group": "missing"},
+            "worker": {"overrides": {}},
+        },
+        "services": {"web": {"task_definition": "web"}},
+        "before_deploy": [{"task_definition": "web", "container": "web"}],
+    }
+    with pytest.raises(ValidationError) as exc_info:
+        validate_config(config)
+
+    assert exc_info.value.errors == [
+        "config.environment.DEBUG: expected a scalar value",
+        "config.task_definitions.worker: missing required key 'template'",
+        "config.before_deploy[0]: missing required key 'command'",
+    ]
+
+
+def test_validate_config_lenient(caplog):
+    config = {
+        "cluster_name": "default",
+        "environment": {"FOO": None},
+        "environment_groups": None,
+        "secrets": None,
+        "task_definitions": {"web": {"template": "web.json"}},
+        "services": {"web": {"task_definition": "web", "desired_count": 2}},
+        "scheduled_tasks": {"cleanup": {"schedule": "rate(1 day)"}},
+    }
+    validate_config(config)
+
+    assert [r.getMessage() for r in caplog.records] == [
+        "config.services.web: unknown key 'desired_count' is ignored",
+        "config.scheduled_tasks.cleanup: unknown key 'schedule' is ignored",
+    ]
+
+
+def test_validate_config_references():
+    config = {
+        "cluster_name": "default",
+        "task_definitions": {
+            "web": {"template": "web.json", "environment_group": "missing"},
+        },
+        "services": {"web": {"task_definition": "web-1"}},
+        "scheduled_tasks": {"cron": {"task_definition": "cron"}},
+    }
+    with pytest.raises(ValidationError) as exc_info:
+        validate_config(config)
+
+    assert exc_info.value.errors == [
+        "Unknown environment group 'missing' for task definition 'web'",
+        "services.web: unknown task definition 'web-1'",
+        "scheduled_tasks.cron: unknown task definition 'cron'",
+    ]
+
+
+def test_validate_task_definitions(definition):
+    config = {"task_definitions": {"web": {"overrides": {"default": {"cpu": 10}}}}}
+    validate_task_definitions(config, {"web": definition})
+
+
+def test_validate_task_definitions_errors():
+    definition = TaskDefinition(
+        {
+            "family": "web",
+            "cpu": "256",
+            "memory": "512",
+            "containerDefinitions": [
+                {"name": "web", "image": "web:1.0", "cpu": 200, "memory": 512},
+                {"name": "worker", "image": "web:1.0", "cpu": 100, "memory": 1024},
+                {"name": "proxy", "image": "proxy:1.0", "privileged": "yes"},
+            ],
+        }
+    )
+    config = {
+        "task_definitions": {
+            "web": {
+                "overrides": {
+                    "web": {"memmory": 512},
+                    "missing": {},
+                }
+            }
+        }
+    }
+    with pytest.raises(ValidationError) as exc_info:
+        validate_task_definitions(config, {"web": definition})
+
+    errors = exc_info.value.errors
+    assert errors[0].startswith("Task definition 'web' is invalid: ")
+    assert "privileged" in errors[0]
+    assert errors[1:] == [
+        "Overrides of task definition 'web' contain unknown key 'memmory' for "
+        "container 'web'",
+        "Overrides of task definition 'web' reference unknown container 'missing'",
+        "Containers of task definition 'web' use 300 cpu units, the task only has 256",
+        "Containers of task definition 'web' reserve 1536 MiB memory, the task "
+        "only has 512 MiB",
+    ]
+
+
+def test_validate_task_definitions_size(definition):
+    definition.container_definitions[0]["environment"] = {
+        "VAR_%d" % i: "x" * 100 for i in range(1000)
+    }
+    with pytest.raises(ValidationError, match="the maximum is 65536 bytes"):
+        validate_task_definitions({"task_definitions": {}}, {"web": definition})
+
+
+def test_run_invalid_config(example_project, caplog):
+    config = example_project.read()
+    example_project.write(
+        config.replace("web:\n    task_definition: web", "web:\n    task_definition: x")
+    )
+    with pytest.raises(SystemExit):
+        cli.run(
+            filename=example_project.strpath,
+            template_vars={"image": "my-docker-image:1.0"},
+        )
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert lines == [
+        "Invalid configuration, exiting",
+        " - services.web: unknown task definition 'x'",
+    ]
@@ -0,0 +1,103 @@
+import logging
+
+from botocore.stub import Stubber
+
+from ecs_deplojo import deployment, watcher
+
+ARN = "arn:aws:ecs:eu-west-1:123456789012:service-deployment/default/%s/%s"
+
+
+def test_service_deployments_watcher(connection, caplog):
+    stubber = Stubber(connection.ecs)
+    for service_name, arns in [("web", ["a"]), ("worker", ["b", "c"])]:
+        stubber.add_response(
+            "list_service_deployments",
+            {
+                "serviceDeployments": [
+                    {"serviceDeploymentArn": ARN % (service_name, arn)} for arn in arns
+                ]
+            },
+            {
+                "cluster": "default",
+                "service": service_name,
+                "status": watcher.ACTIVE_STATUSES,
+            },
+        )
+    stubber.add_response(
+        "describe_service_deployments",
+        {
+            "serviceDeployments": [
+                {"serviceDeploymentArn": ARN % ("web", "a"), "status": "IN_PROGRESS"},
+                {"serviceDeploymentArn": ARN % ("worker", "b"), "status": "SUCCESSFUL"},
+                {"serviceDeploymentArn": ARN % ("worker", "c"), "status": "PENDING"},
+            ]
+        },
+        {
+            "serviceDeploymentArns": [
+                ARN % ("web", "a"),
+                ARN % ("worker", "b"),
+                ARN % ("worker", "c"),
+            ]
+        },
+    )
+    stubber.add_response(
+        "describe_service_deployments",
+        {
+            "serviceDeployments": [
+                {"serviceDeploymentArn": ARN % ("web", "a"), "status": "SUCCESSFUL"},
+                {
+                    "serviceDeploymentArn": ARN % ("worker", "c"),
+                    "status": "ROLLBACK_SUCCESSFUL",
+                    "statusReason": "circuit breaker",
+                },
+            ]
+        },
+        {"serviceDeploymentArns": [ARN % ("web", "a"), ARN % ("worker", "c")]},
+    )
+
+    service_watcher = watcher.ServiceDeploymentsWatcher(
+        connection, "default", ["web", "worker"]
+    )
+    with stubber:
+        assert service_watcher.in_progress() == {"web", "worker"}
+        assert service_watcher.in_progress() == set()
+    stubber.assert_no_pending_responses()
+
+    assert caplog.records[-1].levelno == logging.WARNING
+    assert caplog.records[-1].getMessage() == (
+        "Deployment of worker ended with status ROLLBACK_SUCCESSFUL: circuit breaker"
+    )
+
+
+def test_wait_for_deployments_lightweight(
+    cluster, connection, definition, monkeypatch, caplog
+):
+    retval = connection.ecs.register_task_definition(**definition.as_dict())
+    connection.ecs.create_service(
+        cluster="default",
+        serviceName="web",
+        taskDefinition=retval["taskDefinition"]["taskDefinitionArn"],
+        desiredCount=1,
+    )
+    polls = iter([{"web"}, set(), set()])
+    monkeypatch.setattr(
+        watcher.ServiceDeploymentsWatcher, "in_progress", lambda self: next(polls)
+    )
+
+    assert deployment.wait_for_deployments(
+        connection, "default", ["web"], lightweight_polling=True
+    )
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert lines == ["Waiting for deployments", "Deployment finished: web (1/1)"]
+
+
+def test_wait_for_deployments_unsupported(cluster, connection, monkeypatch, caplog):
+    monkeypatch.setattr(deployment, "supports_service_deployments", lambda c: False)
+
+    assert deployment.wait_for_deployments(
+        connection, "default", [], lightweight_polling=True
+    )
+
+    lines = [r.message for r in caplog.records if r.name.startswith("deploy")]
+    assert lines[1].startswith("The service deployments API is not supported")